@@ -1,6 +1,7 @@
 """
 Configuration management using pydantic-settings
 """
+from functools import cached_property, lru_cache
 from pydantic_settings import BaseSettings
 from typing import List
 
@@ -11,6 +12,7 @@ class Settings(BaseSettings):
     # OpenAI Configuration
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o-mini"
+    LLM_MAX_RETRIES: int = 3  # Retries on rate limits, timeouts and 5xx errors
 
     # Query Routing Configuration (Production Scale)
     ENABLE_QUERY_ROUTING: bool = True  # Enable intelligent routing
@@ -18,24 +20,46 @@ class Settings(BaseSettings):
     DEFAULT_MODEL_FOR_MEDIUM: str = "gpt-3.5-turbo"  # Use GPT-3.5 for medium
     DEFAULT_MODEL_FOR_COMPLEX: str = "gpt-4"  # Use GPT-4 for complex
 
+    # LLM Response Cache Configuration
+    LLM_CACHE_SIZE: int = 1000  # Max cached (model, schema, question, context) answers
+    LLM_CACHE_TTL_SECONDS: int = 3600  # How long a cached answer stays valid
+    ENABLE_SEMANTIC_CACHE: bool = False  # Reuse answers for paraphrased questions
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # Min cosine similarity for a hit
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    LLM_SCHEMA_TOKEN_BUDGET: int = 6000  # Trim schemas estimated above this size
+    LLM_SCHEMA_MAX_COLUMNS: int = 40  # Columns kept when a schema is trimmed
+
+    # LLM Request Batching Configuration
+    ENABLE_LLM_BATCHING: bool = False  # Coalesce concurrent requests into one call
+    LLM_BATCH_MAX_SIZE: int = 8  # Max requests per batched call
+    LLM_BATCH_MAX_WAIT_MS: int = 30  # How long to wait for more requests
+
     # CORS Configuration
     CORS_ORIGINS: str = "http://localhost:5173,http://localhost:8080"
 
     # Session Configuration
+    # Each live session holds its own in-memory DuckDB database, so memory and
+    # worker threads scale with the number of sessions alive within the TTL
     SESSION_TTL_HOURS: int = 2
+    DUCKDB_SESSION_THREADS: int = 2
+    DUCKDB_SESSION_MEMORY_LIMIT: str = "512MB"
     MAX_FILE_SIZE_MB: int = 100
     UPLOADS_DIR: str = "uploads"
+    # Byte-identical uploads share one session (and its ID, so any uploader
+    # can delete it for everyone); only enable for single-user deployments
+    DEDUPLICATE_UPLOADS: bool = False
 
     # Server Configuration
     PORT: int = 8000
     HOST: str = "0.0.0.0"
 
-    @property
+    # Settings don't change after startup, so derived values are computed once
+    @cached_property
     def cors_origins_list(self) -> List[str]:
         """Parse CORS origins string into list"""
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",")]
 
-    @property
+    @cached_property
     def max_file_size_bytes(self) -> int:
         """Convert MB to bytes"""
         return self.MAX_FILE_SIZE_MB * 1024 * 1024
@@ -45,5 +69,11 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build settings once; later calls reuse the parsed instance"""
+    return Settings()
+
+
 # Global settings instance
-settings = Settings()
+settings = get_settings()
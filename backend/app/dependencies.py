@@ -0,0 +1,22 @@
+"""
+Shared service dependencies for route handlers
+"""
+from fastapi import Request
+from app.services.session_service import SessionService
+from app.services.duckdb_service import DuckDBService
+from app.services.llm_service import LLMService
+
+
+def get_session_service(request: Request) -> SessionService:
+    """Return the app-wide SessionService created at startup"""
+    return request.app.state.sessions
+
+
+def get_duckdb_service(request: Request) -> DuckDBService:
+    """Return the app-wide DuckDBService created at startup"""
+    return request.app.state.duckdb
+
+
+def get_llm_service(request: Request) -> LLMService:
+    """Return the app-wide LLMService created at startup"""
+    return request.app.state.llm
@@ -1,8 +1,10 @@
 """
 FastAPI application entry point
 """
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import duckdb
@@ -10,6 +12,8 @@ import duckdb
 from app.config import settings
 from app.routers import health, upload, query
 from app.services.session_service import SessionService
+from app.services.duckdb_service import DuckDBService
+from app.services.llm_service import LLMService
 
 
 # Background scheduler for cleanup tasks
@@ -21,10 +25,25 @@ async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup and shutdown events
     """
-    # Startup: Start background cleanup scheduler
+    # Startup: Create shared service instances so every router uses the
+    # same DuckDB connections and caches
     session_service = SessionService()
+    duckdb_service = DuckDBService()
+    app.state.sessions = session_service
+    app.state.duckdb = duckdb_service
+    llm_service = LLMService()
+    app.state.llm = llm_service
+    await llm_service.warmup()
+
+    # Start background cleanup scheduler
+    async def cleanup_sessions():
+        # Delete expired CSVs and close their cached DuckDB connections, with
+        # the blocking file and DuckDB work kept off the event loop
+        for session_id in await session_service.cleanup_expired_sessions_async():
+            await asyncio.to_thread(duckdb_service.close_session, session_id)
+
     scheduler.add_job(
-        session_service.cleanup_expired_sessions,
+        cleanup_sessions,
         'interval',
         hours=1,
         id='cleanup_sessions'
@@ -38,6 +57,9 @@ async def lifespan(app: FastAPI):
     scheduler.shutdown()
     print("✅ Background cleanup scheduler stopped")
 
+    # Release pooled OpenAI connections
+    await llm_service.close()
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -45,6 +67,7 @@ app = FastAPI(
     description="Backend API for natural language data querying with DuckDB",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # Fast serialization of large result sets
     redoc_url=None  # Disable ReDoc documentation
 )
 
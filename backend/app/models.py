@@ -1,7 +1,7 @@
 """
 Pydantic models for request/response validation
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 
 
@@ -56,6 +56,16 @@ class QueryResponse(BaseModel):
     error: Optional[str] = None
 
 
+class LLMSQLResponse(BaseModel):
+    """Structured reply expected from the SQL-generation LLM"""
+    model_config = ConfigDict(extra="allow")
+
+    sql: Optional[str]
+    ask_clarification: bool
+    clarification: Optional[Dict[str, Any]] = None
+    explanation: Optional[str] = None
+
+
 # SQL Execution Models
 class ExecuteSQLRequest(BaseModel):
     """Request to execute raw SQL"""
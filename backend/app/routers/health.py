@@ -8,6 +8,9 @@ from app import __version__
 
 router = APIRouter()
 
+# DuckDB version is fixed for the process lifetime, so resolve it once
+_DUCKDB_VERSION = duckdb.__version__
+
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -15,13 +18,8 @@ async def health_check():
     Health check endpoint
     Returns the API status and DuckDB version
     """
-    # Get DuckDB version
-    conn = duckdb.connect(':memory:')
-    duckdb_version = conn.execute("SELECT version()").fetchone()[0]
-    conn.close()
-
     return HealthResponse(
         status="healthy",
-        duckdb_version=duckdb_version,
+        duckdb_version=_DUCKDB_VERSION,
         version=__version__
     )
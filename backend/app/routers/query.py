@@ -1,7 +1,8 @@
 """
 Query execution endpoints (natural language and SQL)
 """
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from app.models import (
     QueryRequest, QueryResponse,
     ExecuteSQLRequest, ExecuteSQLResponse,
@@ -10,15 +11,17 @@ from app.models import (
 from app.services.session_service import SessionService
 from app.services.duckdb_service import DuckDBService
 from app.services.llm_service import LLMService
+from app.dependencies import get_session_service, get_duckdb_service, get_llm_service
 
 router = APIRouter()
-session_service = SessionService()
-duckdb_service = DuckDBService()
-llm_service = LLMService()
 
 
 @router.get("/sessions/{session_id}/schema", response_model=SchemaResponse)
-async def get_schema(session_id: str):
+async def get_schema(
+    session_id: str,
+    session_service: SessionService = Depends(get_session_service),
+    duckdb_service: DuckDBService = Depends(get_duckdb_service)
+):
     """
     Get the schema of the uploaded CSV
 
@@ -37,7 +40,9 @@ async def get_schema(session_id: str):
 
     try:
         csv_path = session_service.get_csv_path(session_id)
-        columns, row_count = duckdb_service.get_schema(csv_path)
+        columns, row_count = await run_in_threadpool(
+            duckdb_service.get_schema, session_id, csv_path
+        )
 
         return SchemaResponse(
             session_id=session_id,
@@ -52,7 +57,12 @@ async def get_schema(session_id: str):
 
 
 @router.post("/query", response_model=QueryResponse)
-async def execute_query(request: QueryRequest):
+async def execute_query(
+    request: QueryRequest,
+    session_service: SessionService = Depends(get_session_service),
+    duckdb_service: DuckDBService = Depends(get_duckdb_service),
+    llm_service: LLMService = Depends(get_llm_service)
+):
     """
     Execute a natural language query using LLM to generate SQL
 
@@ -72,8 +82,9 @@ async def execute_query(request: QueryRequest):
     try:
         # Get schema for LLM context
         csv_path = session_service.get_csv_path(request.session_id)
-        columns, _ = duckdb_service.get_schema(csv_path)
-        schema_text = duckdb_service.format_schema_for_llm(columns)
+        columns, schema_text = await run_in_threadpool(
+            duckdb_service.get_llm_schema, request.session_id, csv_path
+        )
 
         # Prepare schema dict for complexity analysis
         # Convert ColumnSchema objects to dictionaries
@@ -109,8 +120,10 @@ async def execute_query(request: QueryRequest):
                 explanation=llm_response.get("explanation", "I understand. How can I help you with your data?")
             )
 
-        # Execute SQL with DuckDB
-        columns_list, rows = duckdb_service.execute_query(csv_path, sql)
+        # Execute SQL with DuckDB in a worker thread to keep the event loop free
+        columns_list, rows = await run_in_threadpool(
+            duckdb_service.execute_query, request.session_id, csv_path, sql
+        )
 
         return QueryResponse(
             sql=sql,
@@ -130,7 +143,11 @@ async def execute_query(request: QueryRequest):
 
 
 @router.post("/execute-sql", response_model=ExecuteSQLResponse)
-async def execute_sql(request: ExecuteSQLRequest):
+async def execute_sql(
+    request: ExecuteSQLRequest,
+    session_service: SessionService = Depends(get_session_service),
+    duckdb_service: DuckDBService = Depends(get_duckdb_service)
+):
     """
     Execute raw SQL query
 
@@ -149,7 +166,9 @@ async def execute_sql(request: ExecuteSQLRequest):
 
     try:
         csv_path = session_service.get_csv_path(request.session_id)
-        columns, rows = duckdb_service.execute_query(csv_path, request.sql)
+        columns, rows = await run_in_threadpool(
+            duckdb_service.execute_query, request.session_id, csv_path, request.sql
+        )
 
         return ExecuteSQLResponse(
             columns=columns,
@@ -1,19 +1,48 @@
 """
 CSV upload and session management endpoints
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
+from typing import AsyncIterator
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from app.models import UploadResponse, DeleteSessionResponse
 from app.services.session_service import SessionService
 from app.services.duckdb_service import DuckDBService
+from app.dependencies import get_session_service, get_duckdb_service
 from app.config import settings
 
 router = APIRouter()
-session_service = SessionService()
-duckdb_service = DuckDBService()
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def _read_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    """
+    Yield the uploaded file in chunks, enforcing the size limit as we go
+
+    Args:
+        file: Uploaded file
+
+    Yields:
+        Chunks of file content
+    """
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > settings.max_file_size_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File size exceeds {settings.MAX_FILE_SIZE_MB}MB limit"
+            )
+        yield chunk
 
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_csv(file: UploadFile = File(...)):
+async def upload_csv(
+    file: UploadFile = File(...),
+    session_service: SessionService = Depends(get_session_service),
+    duckdb_service: DuckDBService = Depends(get_duckdb_service)
+):
     """
     Upload a CSV file and create a new session
 
@@ -30,23 +59,17 @@ async def upload_csv(file: UploadFile = File(...)):
             detail="Only CSV files are allowed"
         )
 
-    # Read file content
-    content = await file.read()
-
-    # Check file size
-    if len(content) > settings.max_file_size_bytes:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File size exceeds {settings.MAX_FILE_SIZE_MB}MB limit"
-        )
-
     # Save file and create session
     try:
-        session_id = await session_service.create_session(file.filename, content)
+        session_id = await session_service.create_session(
+            file.filename, _read_chunks(file)
+        )
 
         # Get file info using DuckDB
         csv_path = session_service.get_csv_path(session_id)
-        row_count, column_count = duckdb_service.get_file_info(csv_path)
+        row_count, column_count = await run_in_threadpool(
+            duckdb_service.get_file_info, session_id, csv_path
+        )
 
         return UploadResponse(
             session_id=session_id,
@@ -54,6 +77,8 @@ async def upload_csv(file: UploadFile = File(...)):
             row_count=row_count,
             column_count=column_count
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -62,7 +87,11 @@ async def upload_csv(file: UploadFile = File(...)):
 
 
 @router.delete("/sessions/{session_id}", response_model=DeleteSessionResponse)
-async def delete_session(session_id: str):
+async def delete_session(
+    session_id: str,
+    session_service: SessionService = Depends(get_session_service),
+    duckdb_service: DuckDBService = Depends(get_duckdb_service)
+):
     """
     Delete a session and its associated CSV file
 
@@ -74,6 +103,7 @@ async def delete_session(session_id: str):
     """
     try:
         success = session_service.delete_session(session_id)
+        await run_in_threadpool(duckdb_service.close_session, session_id)
 
         if success:
             return DeleteSessionResponse(
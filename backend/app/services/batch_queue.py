@@ -0,0 +1,135 @@
+"""
+Micro-batching of concurrent LLM requests.
+Requests for the same model that arrive within a short window are sent as
+one multi-prompt API call.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+# (model, prompt) -> reply text. Prompts are opaque to the queue.
+SingleCall = Callable[[str, Any], Awaitable[str]]
+# (model, prompts) -> one reply text per prompt, in order
+BatchCall = Callable[[str, List[Any]], Awaitable[List[str]]]
+
+
+class BatchQueue:
+    """
+    Collects requests for up to max_wait seconds (or max_batch requests)
+    and dispatches each model's group as a single batched call.
+
+    A group of one uses the single-call path, and a failed batch falls back
+    to individual calls so one bad reply can't fail every request in it.
+    """
+
+    def __init__(
+        self,
+        single_call: SingleCall,
+        batch_call: BatchCall,
+        max_batch: int = 8,
+        max_wait: float = 0.03
+    ):
+        self.single_call = single_call
+        self.batch_call = batch_call
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "asyncio.Queue[Tuple[str, Any, asyncio.Future]]" = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatches: set = set()
+
+    async def submit(self, model: str, prompt: Any) -> str:
+        """
+        Queue a request and wait for its reply.
+
+        Args:
+            model: OpenAI model name
+            prompt: Prompt for this request, passed through to the call functions
+
+        Returns:
+            Raw reply text for this request
+        """
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((model, prompt, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop the background worker"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self) -> None:
+        """Drain the queue into batches until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Only requests for the same model can share a call
+            groups: Dict[str, List[Tuple[Any, asyncio.Future]]] = {}
+            for model, prompt, future in batch:
+                groups.setdefault(model, []).append((prompt, future))
+
+            # Dispatch without blocking the next collection window
+            for model, items in groups.items():
+                task = asyncio.create_task(self._dispatch(model, items))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(
+        self,
+        model: str,
+        items: List[Tuple[Any, asyncio.Future]]
+    ) -> None:
+        """
+        Send one model's group and resolve each request's future.
+
+        Args:
+            model: OpenAI model name
+            items: (prompt, future) pairs
+        """
+        if len(items) > 1:
+            try:
+                replies = await self.batch_call(model, [prompt for prompt, _ in items])
+                if len(replies) != len(items):
+                    raise ValueError("Batched reply count does not match requests")
+            except Exception:
+                replies = None
+            if replies is not None:
+                for (_, future), reply in zip(items, replies):
+                    if not future.done():
+                        future.set_result(reply)
+                return
+
+        await asyncio.gather(*(self._dispatch_one(model, *item) for item in items))
+
+    async def _dispatch_one(
+        self,
+        model: str,
+        prompt: Any,
+        future: asyncio.Future
+    ) -> None:
+        """Send a single request and resolve its future"""
+        try:
+            reply = await self.single_call(model, prompt)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(reply)
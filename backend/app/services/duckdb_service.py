@@ -2,91 +2,208 @@
 DuckDB service for CSV querying
 """
 import duckdb
-from typing import List, Tuple, Dict, Any
+import orjson
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple, Dict, Any, Iterator
+from app.config import settings
 from app.models import ColumnSchema
 
 
 class DuckDBService:
     """Service for DuckDB operations on CSV files"""
 
-    def get_file_info(self, csv_path: str) -> Tuple[int, int]:
+    def __init__(self):
+        # One in-memory database per session, so a session's SQL can never
+        # see another session's tables. Each session's CSV is loaded once
+        # as a "data" table, after which the database's file access is
+        # turned off.
+        self._conns: Dict[str, duckdb.DuckDBPyConnection] = {}
+        # The CSV never changes within a session, so schema lookups are
+        # memoized as (columns, row_count, schema_text for the LLM)
+        self._schema_cache: Dict[str, Tuple[List[ColumnSchema], int, str]] = {}
+        self._lock = threading.Lock()
+
+    def _load_session(self, session_id: str, csv_path: str) -> duckdb.DuckDBPyConnection:
         """
-        Get basic file information (row count and column count)
+        Get the session's DuckDB connection, loading the CSV on first use
 
         Args:
+            session_id: Session ID
             csv_path: Path to CSV file
 
         Returns:
-            Tuple of (row_count, column_count)
+            Connection to the session's database holding the "data" table
         """
-        conn = duckdb.connect(':memory:')
+        with self._lock:
+            conn = self._conns.get(session_id)
+        if conn is not None:
+            return conn
+
+        # Parse the CSV outside the lock so other sessions aren't blocked
+        # Cap each session's database; the defaults (all cores, 80% of RAM)
+        # would apply to every session separately
+        conn = duckdb.connect(':memory:', config={
+            'threads': settings.DUCKDB_SESSION_THREADS,
+            'memory_limit': settings.DUCKDB_SESSION_MEMORY_LIMIT
+        })
         try:
-            # Get row count - convert to Python int
-            row_count = int(conn.execute(
-                f"SELECT COUNT(*) FROM read_csv_auto('{csv_path}')"
-            ).fetchone()[0])
+            # Bind the path as a parameter rather than splicing it into SQL
+            conn.execute("CREATE TABLE data AS SELECT * FROM read_csv_auto(?)", [csv_path])
+            # Queries only need the loaded table; block reading other files
+            # (including other sessions' uploads). This can't be undone.
+            conn.execute("SET enable_external_access = false")
+        except Exception:
+            conn.close()
+            raise
 
-            # Get column count - DESCRIBE returns a row for each column
-            describe_result = conn.execute(
-                f"DESCRIBE SELECT * FROM read_csv_auto('{csv_path}')"
-            ).fetchall()
-            column_count = len(describe_result)
+        with self._lock:
+            existing = self._conns.setdefault(session_id, conn)
+        if existing is not conn:
+            # Another request loaded the same session concurrently
+            conn.close()
+        return existing
+
+    @contextmanager
+    def cursor(self, session_id: str, csv_path: str) -> Iterator[duckdb.DuckDBPyConnection]:
+        """
+        Open a cursor on the session's database
 
-            return row_count, column_count
+        Requests run in worker threads and a DuckDB connection must not be
+        used from several threads at once, so each call gets its own cursor.
+
+        Args:
+            session_id: Session ID
+            csv_path: Path to CSV file
+
+        Yields:
+            Cursor with the CSV available as table "data"
+        """
+        cursor = self._load_session(session_id, csv_path).cursor()
+        try:
+            yield cursor
         finally:
+            cursor.close()
+
+    def close_session(self, session_id: str) -> None:
+        """
+        Close the session's database and drop its cached schema, if any
+
+        Args:
+            session_id: Session ID
+        """
+        with self._lock:
+            conn = self._conns.pop(session_id, None)
+            self._schema_cache.pop(session_id, None)
+        if conn is not None:
             conn.close()
 
-    def get_schema(self, csv_path: str) -> Tuple[List[ColumnSchema], int]:
+    def get_file_info(self, session_id: str, csv_path: str) -> Tuple[int, int]:
+        """
+        Get basic file information (row count and column count)
+
+        Args:
+            session_id: Session ID
+            csv_path: Path to CSV file
+
+        Returns:
+            Tuple of (row_count, column_count)
+        """
+        # Reuse the schema lookup so the upload also warms the schema cache
+        # for the session's first query
+        columns, row_count, _ = self._get_cached_schema(session_id, csv_path)
+        column_count = len(columns)
+
+        return row_count, column_count
+
+    def get_schema(self, session_id: str, csv_path: str) -> Tuple[List[ColumnSchema], int]:
         """
         Get schema information for the CSV file
 
         Args:
+            session_id: Session ID
             csv_path: Path to CSV file
 
         Returns:
             Tuple of (list of ColumnSchema objects, row_count)
         """
-        conn = duckdb.connect(':memory:')
-        try:
-            # Get column information
-            schema_df = conn.execute(
-                f"DESCRIBE SELECT * FROM read_csv_auto('{csv_path}')"
-            ).df()
+        columns, row_count, _ = self._get_cached_schema(session_id, csv_path)
+        return columns, row_count
+
+    def get_llm_schema(self, session_id: str, csv_path: str) -> Tuple[List[ColumnSchema], str]:
+        """
+        Get schema columns together with their LLM prompt formatting
+
+        Args:
+            session_id: Session ID
+            csv_path: Path to CSV file
+
+        Returns:
+            Tuple of (list of ColumnSchema objects, formatted schema string)
+        """
+        columns, _, schema_text = self._get_cached_schema(session_id, csv_path)
+        return columns, schema_text
+
+    def _get_cached_schema(
+        self,
+        session_id: str,
+        csv_path: str
+    ) -> Tuple[List[ColumnSchema], int, str]:
+        """
+        Look up the session's schema, computing it on first use
+
+        Args:
+            session_id: Session ID
+            csv_path: Path to CSV file
 
-            # Get sample values (first row)
-            sample_df = conn.execute(
-                f"SELECT * FROM read_csv_auto('{csv_path}') LIMIT 1"
-            ).df()
+        Returns:
+            Tuple of (list of ColumnSchema objects, row_count, schema_text)
+        """
+        cached = self._schema_cache.get(session_id)
+        if cached is not None:
+            return cached
+
+        columns, row_count = self._load_schema(session_id, csv_path)
+        cached = (columns, row_count, self.format_schema_for_llm(columns))
+
+        with self._lock:
+            # Skip caching if the session was closed while loading
+            if session_id in self._conns:
+                self._schema_cache[session_id] = cached
+        return cached
+
+    def _load_schema(self, session_id: str, csv_path: str) -> Tuple[List[ColumnSchema], int]:
+        """
+        Read column types, sample values and row count from DuckDB
+
+        Args:
+            session_id: Session ID
+            csv_path: Path to CSV file
+
+        Returns:
+            Tuple of (list of ColumnSchema objects, row_count)
+        """
+        with self.cursor(session_id, csv_path) as cursor:
+            # Get column information - one (name, type, ...) tuple per column
+            describe_rows = cursor.execute("DESCRIBE data").fetchall()
+
+            # Get sample values (first row) as native Python values
+            sample_rows = self._fetch_rows(cursor.sql("SELECT * FROM data LIMIT 1"))
+            sample_row = sample_rows[0] if sample_rows else None
 
             # Get row count - convert to Python int
-            row_count = int(conn.execute(
-                f"SELECT COUNT(*) FROM read_csv_auto('{csv_path}')"
-            ).fetchone()[0])
-
-            # Build column schema list
-            columns = []
-            for _, row in schema_df.iterrows():
-                col_name = row['column_name']
-                col_type = row['column_type']
-
-                # Get sample value and convert numpy types to Python native types
-                if not sample_df.empty:
-                    sample_value = sample_df[col_name].iloc[0]
-                    # Convert numpy types to Python native types for JSON serialization
-                    if hasattr(sample_value, 'item'):
-                        sample_value = sample_value.item()
-                else:
-                    sample_value = None
-
-                columns.append(ColumnSchema(
-                    name=col_name,
-                    type=col_type,
-                    sample=sample_value
-                ))
-
-            return columns, row_count
-        finally:
-            conn.close()
+            row_count = int(cursor.execute("SELECT COUNT(*) FROM data").fetchone()[0])
+
+        if sample_row is None:
+            sample_row = (None,) * len(describe_rows)
+
+        # Build column schema list
+        columns = [
+            ColumnSchema(name=col_name, type=col_type, sample=sample_value)
+            for (col_name, col_type, *_), sample_value in zip(describe_rows, sample_row)
+        ]
+
+        return columns, row_count
 
     def format_schema_for_llm(self, columns: List[ColumnSchema]) -> str:
         """
@@ -98,42 +215,117 @@ class DuckDBService:
         Returns:
             Formatted schema string
         """
+        # No trailing whitespace, so equal schemas always hash (and prefix-cache)
+        # identically
         schema_lines = []
         for col in columns:
-            sample_str = f"e.g. {col.sample}" if col.sample is not None else ""
-            schema_lines.append(f"- {col.name} ({col.type}) {sample_str}")
+            line = f"- {col.name} ({col.type})"
+            if col.sample is not None:
+                line += f" e.g. {col.sample}"
+            schema_lines.append(line)
 
         return "\n".join(schema_lines)
 
-    def execute_query(self, csv_path: str, sql: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    def execute_query(
+        self,
+        session_id: str,
+        csv_path: str,
+        sql: str
+    ) -> Tuple[List[str], List[Dict[str, Any]]]:
         """
         Execute SQL query on CSV file
 
         Args:
+            session_id: Session ID
             csv_path: Path to CSV file
             sql: SQL query to execute
 
         Returns:
             Tuple of (column_names, rows as list of dicts)
         """
-        conn = duckdb.connect(':memory:')
-        try:
-            # Register CSV as a view named "data"
-            conn.execute(f"CREATE VIEW data AS SELECT * FROM read_csv_auto('{csv_path}')")
+        with self.cursor(session_id, csv_path) as cursor:
+            self._check_single_select(cursor, sql)
 
-            # Execute user query
-            result = conn.execute(sql).df()
+            # Also run inside a transaction that is always rolled back, as a
+            # second guard for the cached "data" table
+            cursor.begin()
+            rolled_back = False
+            try:
+                # Execute user query and fetch native Python tuples directly
+                relation = cursor.sql(sql)
+                columns = relation.columns
+                rows = [dict(zip(columns, row)) for row in self._fetch_rows(relation)]
+            finally:
+                # A failed rollback must not replace the query's own result
+                # or error
+                try:
+                    cursor.rollback()
+                    rolled_back = True
+                except Exception:
+                    pass
 
-            # Convert to list of dicts and handle numpy types
-            columns = list(result.columns)
-            rows = result.to_dict('records')
+        if not rolled_back:
+            # The transaction ended some other way, so the table may have
+            # changed; drop the session's database so the next call reloads it
+            self.close_session(session_id)
 
-            # Convert numpy types to Python native types for JSON serialization
-            for row in rows:
-                for key, value in row.items():
-                    if hasattr(value, 'item'):
-                        row[key] = value.item()
+        return columns, rows
 
-            return columns, rows
-        finally:
-            conn.close()
+    @staticmethod
+    def _fetch_rows(relation: duckdb.DuckDBPyRelation) -> List[tuple]:
+        """
+        Fetch a relation's rows with DECIMAL values as floats
+
+        DuckDB returns DECIMAL columns (e.g. literals like 1.5, or
+        ::DECIMAL casts) as decimal.Decimal, which the API would serialize
+        as JSON strings; the frontend only charts JSON numbers.
+
+        Args:
+            relation: Relation to fetch
+
+        Returns:
+            Rows as tuples of native Python values
+        """
+        rows = relation.fetchall()
+        decimal_indexes = [
+            index for index, column_type in enumerate(relation.types)
+            if column_type.id == "decimal"
+        ]
+        if not decimal_indexes:
+            return rows
+
+        converted = []
+        for row in rows:
+            values = list(row)
+            for index in decimal_indexes:
+                if values[index] is not None:
+                    values[index] = float(values[index])
+            converted.append(tuple(values))
+        return converted
+
+    @staticmethod
+    def _check_single_select(cursor: duckdb.DuckDBPyConnection, sql: str) -> None:
+        """
+        Reject anything but a single SELECT statement
+
+        DuckDB's own parser does the check: json_serialize_sql only accepts
+        SELECT statements and reports how many the text contains.
+
+        Args:
+            cursor: Cursor to parse with
+            sql: SQL query to check
+
+        Raises:
+            ValueError: If the SQL doesn't parse or isn't exactly one SELECT
+        """
+        # Doubling quotes fully escapes a standard SQL string literal
+        literal = "'" + sql.replace("'", "''") + "'"
+        parsed = orjson.loads(
+            cursor.execute(f"SELECT json_serialize_sql({literal})").fetchone()[0]
+        )
+        if parsed.get("error"):
+            if parsed.get("error_type") == "parser":
+                raise ValueError(f"Parser Error: {parsed.get('error_message')}")
+            raise ValueError("Only SELECT queries are allowed")
+        if len(parsed.get("statements", [])) != 1:
+            raise ValueError("Only a single SELECT query is allowed")
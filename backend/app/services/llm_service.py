@@ -1,15 +1,30 @@
 """
 LLM service for natural language to SQL conversion
 """
-import json
-from typing import Dict, Any, Optional
-from openai import OpenAI
+import asyncio
+import copy
+import hashlib
+import logging
+import orjson
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Final, List, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI
+from pydantic import ValidationError
 from app.config import settings
-from app.services.query_router import QueryRouter, QueryComplexity
+from app.models import LLMSQLResponse
+from app.services.batch_queue import BatchQueue
+from app.services.query_router import QueryRouter
+from app.services.semantic_cache import SemanticCache
 
+logger = logging.getLogger(__name__)
 
-# System prompt for SQL generation (from frontend prompts.ts)
-SYSTEM_PROMPT = """You are an intelligent data assistant that generates DuckDB SQL queries. Your primary role is to convert data-related questions into safe DuckDB SQL queries, but you should also recognize when users are having casual conversation or providing invalid input.
+# System prompt for SQL generation (from frontend prompts.ts).
+# Kept byte-identical across requests (never formatted) so the provider's
+# automatic prompt-prefix cache can reuse it.
+SYSTEM_PROMPT: Final[str] = """You are an intelligent data assistant that generates DuckDB SQL queries. Your primary role is to convert data-related questions into safe DuckDB SQL queries, but you should also recognize when users are having casual conversation or providing invalid input.
 
 **DATABASE: DuckDB** (NOT SQLite or PostgreSQL - use DuckDB-specific syntax)
 
@@ -52,19 +67,11 @@ Hard rules for DuckDB SQL:
 6) When summarizing, prefer aggregations: COUNT, SUM, AVG, MAX, MIN.
 7) Use COALESCE to guard against NULLs in aggregations when helpful (e.g., COALESCE(SUM("revenue"),0)).
 8) For textual search, use LIKE or ILIKE (case-insensitive) with wildcards unless the user specifies exact match.
-9) For date/time logic, **never assume** the date column; ask unless explicitly named. When a date column **is** provided, use DuckDB date functions.
-
-DuckDB-specific syntax to use:
-- Current date: CURRENT_DATE or today()
-- Date arithmetic: CURRENT_DATE - INTERVAL '1 day', CURRENT_DATE + INTERVAL '7 days'
-- Date truncation: date_trunc('month', "date_column"), date_trunc('year', "date_column")
-- Date casting: CAST("column" AS DATE) or "column"::DATE
-- String functions: LIKE (case-sensitive), ILIKE (case-insensitive)
-- Case-insensitive comparison: Use ILIKE instead of LOWER() with LIKE
+9) For date/time logic, **never assume** the date column; ask unless explicitly named. When a date column **is** provided, use DuckDB date functions (see examples below).
+10) For case-insensitive matching use ILIKE, not LOWER() with LIKE.
 
 When to set "ask_clarification": true (and "sql": null):
-- Date/time queries that **explicitly mention time periods** but don't specify which date column to use (e.g., "last week", "yesterday", "this month").
-  **NOTE:** Only ask for date column clarification if the query contains actual date/time keywords like "last", "yesterday", "today", "this week", etc.
+- Date/time queries that **explicitly mention time periods** ("last week", "yesterday", "today", "this month") but don't name the date column. Only ask when such time keywords are present.
 - Ambiguous metric terms (e.g., "revenue" when multiple columns could match).
 - Ambiguous intent (e.g., "show hotels": list? top N? include which fields?).
 - Unclear grouping or filtering criteria.
@@ -109,7 +116,7 @@ Common patterns for data queries (NOT for greetings/casual conversation):
 - "top N" → ORDER BY "metric" DESC LIMIT N.
 - "group by" → SELECT ..., AGG(...) FROM "data" GROUP BY ...
 
-DuckDB date/time examples (only after the date column is known):
+DuckDB date/time examples (only after the date column is known; CURRENT_DATE, INTERVAL arithmetic, date_trunc and CAST(... AS DATE) or ::DATE):
 - Yesterday: WHERE CAST("col" AS DATE) = CURRENT_DATE - INTERVAL '1 day'
 - Last 7 days (rolling): WHERE CAST("col" AS DATE) >= CURRENT_DATE - INTERVAL '6 days'
 - Last week: WHERE date_trunc('week', CAST("col" AS DATE)) = date_trunc('week', CURRENT_DATE - INTERVAL '1 week')
@@ -125,15 +132,165 @@ Safety:
 - Do **not** interpolate untrusted user text into SQL string literals without quoting; for fuzzy text, use placeholders like '%keyword%'.
 """
 
+# Prebuilt message parts. Messages are [system, schema turn, acknowledgement,
+# question turn]: the first three are identical for every question on the
+# same dataset, so they form a reusable prompt-cache prefix.
+_SYSTEM_MESSAGE: Final[Dict[str, str]] = {"role": "system", "content": SYSTEM_PROMPT}
+_SCHEMA_ACK_MESSAGE: Final[Dict[str, str]] = {"role": "assistant", "content": "Got it."}
+_SCHEMA_HEADER: Final[str] = "Table schema (DuckDB):\n"
+_CONTEXT_HEADER: Final[str] = "Context (answers to prior clarifications):\n"
+_QUESTION_HEADER: Final[str] = "\n\nUser question: "
+
+# Instructions wrapping several requests into one batched call
+_BATCH_HEADER: Final[str] = (
+    "Answer each of the following {count} requests independently, following "
+    "the instructions above for each one. Return a single JSON object of the "
+    'form {{"answers": [...]}} where answers[i] is the JSON response for '
+    "request i + 1."
+)
+_BATCH_ITEM_HEADER: Final[str] = "\n\n### Request {number}\n"
+
+# Canned replies for inputs that don't need the LLM (same text SYSTEM_PROMPT asks for)
+GREETING_RESPONSE: Final[Dict[str, Any]] = {
+    "sql": None,
+    "ask_clarification": False,
+    "clarification": None,
+    "explanation": "Hello! I'm here to help you analyze your data. You can ask me questions like:\n• Top 5 hotels by revenue\n• Average rating by country\n• Count of bookings\n• Show all data\n\nWhat would you like to know about your data?"
+}
+INVALID_INPUT_RESPONSE: Final[Dict[str, Any]] = {
+    "sql": None,
+    "ask_clarification": False,
+    "clarification": None,
+    "explanation": "I don't understand that question. Could you please ask something about your data? For example:\n• Top 5 hotels by revenue\n• Average rating by country\n• Show all data"
+}
+
+# Whole-input greetings and polite phrases ("hi there!", "thanks a lot")
+_GREETING_RE = re.compile(
+    r"^\s*(?:(?:hi|hello|hey)(?:\s+there)?|thanks?(?:\s+(?:you|a lot|so much))?"
+    r"|thank\s+you(?:\s+(?:so|very)\s+much)?|good\s+(?:morning|afternoon|evening)"
+    r"|(?:good)?bye)\s*[!.?]*\s*$",
+    re.IGNORECASE
+)
+
+# Outermost {...} span in a reply that wraps JSON in prose
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Replies longer than this are parsed off the event loop. Parsing runs at
+# roughly 1 µs per KB, so below this size a thread hop costs more than the parse.
+LARGE_RESPONSE_CHARS = 256 * 1024
+
+# Rough characters-per-token ratio for English/SQL text, used to estimate
+# prompt size without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Column name at the start of a format_schema_for_llm line ("- name (TYPE) ...")
+_SCHEMA_COLUMN_RE = re.compile(r"^- (.*?) \(")
+
+# Short embeddings keep the semantic cache's similarity scan cheap
+EMBEDDING_DIMENSIONS = 256
+
+# Models that reject response_format={"type": "json_object"}
+JSON_MODE_UNSUPPORTED_MODELS = frozenset({
+    "gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613",
+    "gpt-3.5-turbo-0613", "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613",
+})
+
+# Prebuilt chat.completions.create kwargs for _response_format
+_JSON_RESPONSE_FORMAT: Final[Dict[str, Any]] = {"response_format": {"type": "json_object"}}
+_NO_RESPONSE_FORMAT: Final[Dict[str, Any]] = {}
+
 
 class LLMService:
-    """Service for LLM-based SQL generation with intelligent routing"""
+    """
+    Service for LLM-based SQL generation with intelligent routing.
+
+    One instance is created at startup and shared by all requests. Its
+    caches and in-flight map are plain dicts that are only touched from the
+    event loop, with no await between a read and the matching write, so no
+    locking is needed.
+    """
 
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        # One pooled HTTP client for the process so calls reuse keep-alive
+        # connections instead of paying a TCP+TLS handshake each time
+        timeout = httpx.Timeout(60.0, connect=10.0)
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=200,
+                max_keepalive_connections=100,
+                keepalive_expiry=60
+            ),
+            timeout=timeout
+        )
+        # The SDK retries rate limits, timeouts, 5xx and connection errors
+        # with exponential backoff and jitter, reusing the pooled connections.
+        # The timeout is passed here too since the SDK sets one per request.
+        self.client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=self._http,
+            max_retries=settings.LLM_MAX_RETRIES,
+            timeout=timeout
+        )
         self.model = settings.OPENAI_MODEL
-        self.router = QueryRouter()
-        self.enable_routing = getattr(settings, 'ENABLE_QUERY_ROUTING', True)
+        self.router = QueryRouter(
+            simple_model=settings.DEFAULT_MODEL_FOR_SIMPLE,
+            medium_model=settings.DEFAULT_MODEL_FOR_MEDIUM,
+            complex_model=settings.DEFAULT_MODEL_FOR_COMPLEX
+        )
+        self.enable_routing = settings.ENABLE_QUERY_ROUTING
+
+        # LRU cache of parsed LLM responses as (expires_at, response),
+        # most recently used last
+        self.cache_size = settings.LLM_CACHE_SIZE
+        self.cache_ttl = settings.LLM_CACHE_TTL_SECONDS
+        self._response_cache: OrderedDict[
+            Tuple[str, str, str, str], Tuple[float, Dict[str, Any]]
+        ] = OrderedDict()
+
+        # Futures for LLM calls in progress, so concurrent identical requests
+        # share one call
+        self._inflight: Dict[Tuple[str, str, str, str], asyncio.Future] = {}
+
+        # Optional second-level cache that matches paraphrased questions
+        self.embedding_model = settings.EMBEDDING_MODEL
+        self.semantic_cache = (
+            SemanticCache(
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl=self.cache_ttl
+            )
+            if settings.ENABLE_SEMANTIC_CACHE else None
+        )
+
+        # Oversized schemas are cut down to the most relevant columns
+        self.schema_token_budget = settings.LLM_SCHEMA_TOKEN_BUDGET
+        self.schema_max_columns = settings.LLM_SCHEMA_MAX_COLUMNS
+
+        # Optional micro-batching of concurrent requests into one API call
+        self._batcher = (
+            BatchQueue(
+                self._request_completion,
+                self._request_batch,
+                max_batch=settings.LLM_BATCH_MAX_SIZE,
+                max_wait=settings.LLM_BATCH_MAX_WAIT_MS / 1000
+            )
+            if settings.ENABLE_LLM_BATCHING else None
+        )
+
+    async def warmup(self) -> None:
+        """
+        Open a pooled connection to the OpenAI API ahead of the first query.
+        Best effort: failures are ignored and the first call connects instead.
+        """
+        try:
+            await self._http.head(str(self.client.base_url), timeout=5.0)
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        """Stop the batch worker and close the pooled HTTP client"""
+        if self._batcher is not None:
+            await self._batcher.close()
+        await self._http.aclose()
 
     async def generate_sql(
         self,
@@ -152,40 +309,35 @@ class LLMService:
         Returns:
             Dict with sql, clarification, or error
         """
-        try:
-            # Construct user message
-            user_message = f"""User question: {question}
-
-Table schema (DuckDB):
-{schema}
-
-Context (answers to prior clarifications):
-{json.dumps(context)}"""
-
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.2
-            )
+        # Clarification follow-ups always go to the LLM
+        if not context:
+            trivial = self._classify_trivial(question)
+            if trivial is not None:
+                return trivial
 
-            # Extract content
-            content = response.choices[0].message.content
+        parsed, _ = await self._complete(self.model, question, schema, context)
+        return parsed
 
-            # Parse JSON response
-            parsed = self._parse_llm_response(content)
+    @staticmethod
+    def _classify_trivial(question: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer greetings and obvious gibberish locally, without an API call
 
-            return parsed
+        Args:
+            question: User's natural language question
 
-        except Exception as e:
-            return {
-                "sql": None,
-                "ask_clarification": False,
-                "error": f"LLM error: {str(e)}"
-            }
+        Returns:
+            Canned response dict, or None if the question needs the LLM
+        """
+        if _GREETING_RE.match(question):
+            return dict(GREETING_RESPONSE)
+
+        # No letters at all ("123", "???") or one repeated letter ("qqqq")
+        letters = {char for char in question.lower() if char.isalpha()}
+        if not letters or (len(letters) == 1 and len(question.strip()) > 1):
+            return dict(INVALID_INPUT_RESPONSE)
+
+        return None
 
     async def generate_sql_with_routing(
         self,
@@ -216,6 +368,13 @@ Context (answers to prior clarifications):
         if context is None:
             context = {}
 
+        # Greetings and gibberish never reach the router or the LLM
+        if not context:
+            trivial = self._classify_trivial(question)
+            if trivial is not None:
+                trivial["routing"] = {"strategy": "local", "reason": "Greeting or invalid input"}
+                return trivial
+
         # Check if routing is enabled
         if not self.enable_routing:
             # Fall back to standard generation with configured model
@@ -239,36 +398,13 @@ Context (answers to prior clarifications):
                     "routing": routing_metadata
                 }
 
-            # Determine which model to use based on complexity
-            if complexity == QueryComplexity.MEDIUM:
-                model = "gpt-3.5-turbo"
-            else:  # COMPLEX
-                model = "gpt-4"
-
-            # Construct user message
-            user_message = f"""User question: {question}
-
-Table schema (DuckDB):
-{schema}
-
-Context (answers to prior clarifications):
-{json.dumps(context)}"""
-
-            # Call OpenAI API with selected model
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.2
-            )
+            # Use the model the router picked for this complexity level
+            model = routing_metadata.get("model", self.router.complex_model)
 
-            # Extract and parse content
-            content = response.choices[0].message.content
-            parsed = self._parse_llm_response(content)
+            parsed, cache_info = await self._complete(model, question, schema, context)
 
             # Add routing metadata
+            routing_metadata.update(cache_info)
             parsed["routing"] = routing_metadata
 
             return parsed
@@ -281,34 +417,410 @@ Context (answers to prior clarifications):
                 "routing": {"error": str(e)}
             }
 
-    def _parse_llm_response(self, content: str) -> Dict[str, Any]:
+    async def _complete(
+        self,
+        model: str,
+        question: str,
+        schema: str,
+        context: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, bool]]:
         """
-        Parse LLM response and validate format
+        Ask the LLM for SQL, reusing a cached answer for repeated questions
 
         Args:
-            content: Raw LLM response
+            model: OpenAI model name
+            question: User's natural language question
+            schema: Formatted table schema
+            context: Additional context from previous clarifications
 
         Returns:
-            Parsed and validated response dict
+            Tuple of (dict with sql, clarification, or error; cache info with
+            "cache_hit", and "coalesced" when an identical in-flight call's
+            answer was shared)
+        """
+        scope = self._cache_scope(model, schema, context)
+        cache_key = self._cache_key(scope, question)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            expires_at, cached_response = cached
+            if expires_at > time.monotonic():
+                self._response_cache.move_to_end(cache_key)
+                # Callers attach metadata to the result, so hand out a copy
+                return copy.deepcopy(cached_response), {"cache_hit": True}
+            del self._response_cache[cache_key]
+
+        # An identical request is already calling the LLM: share its answer
+        # (which may be an error, so it isn't reported as a cache hit)
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            try:
+                shared = await asyncio.shield(inflight)
+                return copy.deepcopy(shared), {"cache_hit": False, "coalesced": True}
+            except asyncio.CancelledError:
+                # Re-raise our own cancellation; if the leader was cancelled
+                # instead, make the call ourselves
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            parsed, cache_hit = await self._complete_uncached(
+                model, question, schema, cache_key
+            )
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            if self._inflight.get(cache_key) is future:
+                del self._inflight[cache_key]
+
+        # Followers get their own copy; the caller may mutate parsed
+        future.set_result(copy.deepcopy(parsed))
+        return parsed, {"cache_hit": cache_hit}
+
+    async def _complete_uncached(
+        self,
+        model: str,
+        question: str,
+        schema: str,
+        cache_key: Tuple[str, str, str, str]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Ask the LLM for SQL after an exact cache miss
+
+        Args:
+            model: OpenAI model name
+            question: User's natural language question
+            schema: Formatted table schema
+            cache_key: Exact-match cache key for this request
+
+        Returns:
+            Tuple of (dict with sql, clarification, or error; cache hit flag)
         """
-        # Try to extract JSON from response
+        # Look for an answer to a paraphrase of this question
+        model_name, schema_hash, _, context_json = cache_key
+        semantic_scope = (model_name, schema_hash, context_json)
+        embedding = None
+        if self.semantic_cache is not None:
+            embedding = await self._embed(question)
+            if embedding is not None:
+                similar = self.semantic_cache.lookup(semantic_scope, question, embedding)
+                if similar is not None:
+                    self._cache_response(cache_key, similar)
+                    return copy.deepcopy(similar), True
+
         try:
-            # Look for JSON block
-            if "{" in content and "}" in content:
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                json_str = content[start:end]
-                parsed = json.loads(json_str)
+            # Only the changing fields are formatted per call; the invariant
+            # parts are module constants. The context reuses the key-sorted
+            # JSON from the cache key so equal contexts give identical bytes
+            prompt = (
+                _SCHEMA_HEADER + self._fit_schema(question, schema),
+                _CONTEXT_HEADER + context_json + _QUESTION_HEADER + question
+            )
+
+            if self._batcher is not None:
+                content = await self._batcher.submit(model, prompt)
             else:
-                raise ValueError("No JSON found in response")
+                content = await self._request_completion(model, prompt)
 
-            # Validate required keys
-            if "ask_clarification" not in parsed or "sql" not in parsed:
-                raise ValueError("Missing required keys in response")
+            # Parse JSON response; very large replies are parsed in a worker
+            # thread so they don't stall other requests on the event loop
+            if len(content) > LARGE_RESPONSE_CHARS:
+                parsed = await asyncio.to_thread(self._parse_llm_response, content)
+            else:
+                parsed = self._parse_llm_response(content)
 
-            return parsed
+        except Exception as e:
+            return {
+                "sql": None,
+                "ask_clarification": False,
+                "error": f"LLM error: {str(e)}"
+            }, False
+
+        # Only cache usable answers; errors should be retried next time
+        if "error" not in parsed:
+            self._cache_response(cache_key, parsed)
+            if embedding is not None:
+                self.semantic_cache.add(
+                    semantic_scope, question, embedding, copy.deepcopy(parsed)
+                )
+
+        return parsed, False
+
+    async def _request_completion(self, model: str, prompt: Tuple[str, str]) -> str:
+        """
+        Send one prompt to the chat completions API
+
+        Args:
+            model: OpenAI model name
+            prompt: (schema turn, question turn) user messages
+
+        Returns:
+            Raw reply text
+        """
+        # Stream so the reply can be taken as soon as its JSON object is complete
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=[
+                _SYSTEM_MESSAGE,
+                {"role": "user", "content": prompt[0]},
+                _SCHEMA_ACK_MESSAGE,
+                {"role": "user", "content": prompt[1]}
+            ],
+            temperature=0.2,
+            stream=True,
+            **self._response_format(model)
+        )
+        return await self._read_stream(stream)
+
+    async def _request_batch(
+        self,
+        model: str,
+        prompts: List[Tuple[str, str]]
+    ) -> List[str]:
+        """
+        Send several prompts in one chat completions call
+
+        Args:
+            model: OpenAI model name
+            prompts: (schema turn, question turn) pair for each request
+
+        Returns:
+            Raw JSON reply text for each request, in order
+        """
+        parts = [_BATCH_HEADER.format(count=len(prompts))]
+        for number, (schema_turn, question_turn) in enumerate(prompts, start=1):
+            parts.append(_BATCH_ITEM_HEADER.format(number=number))
+            parts.append(schema_turn + "\n\n" + question_turn)
+
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[_SYSTEM_MESSAGE, {"role": "user", "content": "".join(parts)}],
+            temperature=0.2,
+            **self._response_format(model)
+        )
+        content = response.choices[0].message.content or ""
+
+        try:
+            parsed = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            match = _JSON_RE.search(content)
+            if not match:
+                raise ValueError("No JSON found in batched response")
+            parsed = orjson.loads(match.group(0))
+
+        answers = parsed.get("answers") if isinstance(parsed, dict) else None
+        if not isinstance(answers, list):
+            raise ValueError("Batched response has no answers list")
+        return [orjson.dumps(answer).decode() for answer in answers]
+
+    @staticmethod
+    async def _read_stream(stream) -> str:
+        """
+        Collect a streamed completion, stopping once the first top-level
+        JSON object closes so trailing prose isn't waited for.
+
+        Args:
+            stream: Async chat completion chunk stream
+
+        Returns:
+            Reply text received so far
+        """
+        parts: List[str] = []
+        depth = 0
+        in_string = escaped = False
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                parts.append(text)
+
+                # Track brace depth outside of JSON strings
+                for index, char in enumerate(text):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == "\\":
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"':
+                        in_string = depth > 0
+                    elif char == "{":
+                        depth += 1
+                    elif char == "}" and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            parts[-1] = text[:index + 1]
+                            return "".join(parts)
+        finally:
+            # Cancels the remaining generation if we stopped early
+            await stream.close()
+
+        return "".join(parts)
+
+    def _fit_schema(self, question: str, schema: str) -> str:
+        """
+        Keep the schema within the token budget so an oversized prompt
+        doesn't fail only after a full round-trip
+
+        Args:
+            question: User's natural language question
+            schema: Formatted table schema (one line per column)
+
+        Returns:
+            The schema, or its most question-relevant columns if over budget
+        """
+        if len(schema) // CHARS_PER_TOKEN <= self.schema_token_budget:
+            return schema
+
+        lines = schema.split("\n")
+        if len(lines) <= self.schema_max_columns:
+            return schema
+
+        # Rank columns by how many of their name parts appear in the question;
+        # ties keep schema order, and kept columns stay in schema order
+        question_lower = question.lower()
+
+        def relevance(index: int) -> int:
+            match = _SCHEMA_COLUMN_RE.match(lines[index])
+            name = match.group(1).lower() if match else ""
+            return sum(part in question_lower for part in name.split("_") if part)
+
+        ranked = sorted(range(len(lines)), key=relevance, reverse=True)
+        kept = sorted(ranked[:self.schema_max_columns])
+        trimmed = "\n".join(lines[index] for index in kept)
+
+        saved = (len(schema) - len(trimmed)) // CHARS_PER_TOKEN
+        logger.debug(
+            "Trimmed schema to %d/%d columns (~%d tokens saved)", len(kept), len(lines), saved
+        )
+        return trimmed
+
+    def _cache_response(
+        self,
+        cache_key: Tuple[str, str, str, str],
+        response: Dict[str, Any]
+    ) -> None:
+        """
+        Store a copy of a parsed response in the exact-match cache
+
+        Args:
+            cache_key: Key from _cache_key
+            response: Parsed LLM response
+        """
+        expires_at = time.monotonic() + self.cache_ttl
+        self._response_cache[cache_key] = (expires_at, copy.deepcopy(response))
+        self._response_cache.move_to_end(cache_key)
+        if len(self._response_cache) > self.cache_size:
+            self._response_cache.popitem(last=False)
+
+    async def _embed(self, question: str) -> Optional[List[float]]:
+        """
+        Embed a question for the semantic cache
+
+        Args:
+            question: User's natural language question
 
-        except (json.JSONDecodeError, ValueError) as e:
+        Returns:
+            Embedding vector, or None if the embedding call failed
+        """
+        try:
+            response = await self.client.embeddings.create(
+                model=self.embedding_model,
+                input=question.strip(),
+                dimensions=EMBEDDING_DIMENSIONS
+            )
+            return response.data[0].embedding
+        except Exception:
+            # The semantic cache is best-effort; fall back to the LLM
+            return None
+
+    @staticmethod
+    def _cache_scope(
+        model: str,
+        schema: str,
+        context: Dict[str, Any]
+    ) -> Tuple[str, str, str]:
+        """
+        Build the question-independent part of the response cache key
+
+        Args:
+            model: OpenAI model name
+            schema: Formatted table schema
+            context: Additional context from previous clarifications
+
+        Returns:
+            Tuple of (model, schema hash, canonical context JSON)
+        """
+        schema_hash = hashlib.blake2b(schema.encode(), digest_size=16).hexdigest()
+        context_json = orjson.dumps(context, option=orjson.OPT_SORT_KEYS).decode()
+        return model, schema_hash, context_json
+
+    @staticmethod
+    def _cache_key(
+        scope: Tuple[str, str, str],
+        question: str
+    ) -> Tuple[str, str, str, str]:
+        """
+        Build the response cache key for an LLM request
+
+        Args:
+            scope: Key scope from _cache_scope
+            question: User's natural language question
+
+        Returns:
+            Tuple of (model, schema hash, normalized question, canonical context JSON)
+        """
+        model, schema_hash, context_json = scope
+        # Collapse whitespace only: case can matter (e.g. quoted literals)
+        return model, schema_hash, " ".join(question.split()), context_json
+
+    @staticmethod
+    def _response_format(model: str) -> Dict[str, Any]:
+        """
+        Request JSON mode for models that support it
+
+        Args:
+            model: OpenAI model name
+
+        Returns:
+            Extra keyword arguments for chat.completions.create
+        """
+        if model in JSON_MODE_UNSUPPORTED_MODELS:
+            return _NO_RESPONSE_FORMAT
+        return _JSON_RESPONSE_FORMAT
+
+    def _parse_llm_response(self, content: str) -> Dict[str, Any]:
+        """
+        Parse LLM response and validate format
+
+        Args:
+            content: Raw LLM response
+
+        Returns:
+            Parsed and validated response dict
+        """
+        try:
+            try:
+                # JSON mode guarantees the whole reply is a JSON object, so
+                # parse and validate it in one pass
+                parsed = LLMSQLResponse.model_validate_json(content)
+            except ValidationError:
+                # Models without JSON mode may wrap the object in prose
+                match = _JSON_RE.search(content)
+                if not match:
+                    raise ValueError("No JSON found in response")
+                parsed = LLMSQLResponse.model_validate_json(match.group(0))
+
+            # Keep only the keys the model actually sent
+            return parsed.model_dump(exclude_unset=True)
+
+        except ValueError as e:
             return {
                 "sql": None,
                 "ask_clarification": False,
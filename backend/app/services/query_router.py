@@ -3,6 +3,7 @@ Query routing service for production-scale optimization.
 Routes queries based on complexity to optimize cost while maintaining quality.
 """
 import re
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
@@ -14,57 +15,120 @@ class QueryComplexity(str, Enum):
     COMPLEX = "complex"    # GPT-4
 
 
+def _prepare_templates(templates: Tuple) -> Tuple:
+    """
+    Precompute what QueryTemplate.match needs to know about each template.
+
+    Returns:
+        Tuple of (pattern, literals, template, has_column, has_limit,
+        limit_parts) entries. limit_parts holds the SQL and explanation split
+        around {limit} as (sql_pre, sql_post, exp_pre, exp_post) for
+        templates whose only placeholder is {limit}, else None.
+    """
+    prepared = []
+    for pattern, literals, template in templates:
+        has_column = "column" in pattern.groupindex
+        has_limit = "{limit}" in template["sql"]
+        limit_parts = None
+        if has_limit and not has_column:
+            sql_pre, _, sql_post = template["sql"].partition("{limit}")
+            exp_pre, _, exp_post = template["explanation"].partition("{limit}")
+            limit_parts = (sql_pre, sql_post, exp_pre, exp_post)
+        prepared.append((pattern, literals, template, has_column, has_limit, limit_parts))
+    return tuple(prepared)
+
+
 class QueryTemplate:
     """Template-based query generator for simple queries"""
 
-    # Common simple query patterns
-    TEMPLATES = {
+    # Common simple query patterns, compiled once at import, as
+    # (pattern, literals, template). Patterns run on the stripped, lowercased
+    # question. Every match contains one of the literals, so patterns whose
+    # literals are all absent are skipped.
+    TEMPLATES = (
         # Show all data
-        r"(?i)(show|display|get|select)\s+(all|everything|entire)": {
+        (re.compile(r"(show|display|get|select)\s+(all|everything|entire)"), ("all", "everything", "entire"), {
             "sql": 'SELECT * FROM "data" LIMIT 50',
             "explanation": "Showing first 50 rows of all data"
-        },
-        r"(?i)^(all|everything)$": {
+        }),
+        (re.compile(r"^(all|everything)$"), ("all", "everything"), {
             "sql": 'SELECT * FROM "data" LIMIT 50',
             "explanation": "Showing first 50 rows of all data"
-        },
+        }),
+
+        # Top N rows ranked by a column (column must exist in the schema)
+        (re.compile(r"^(show|display|get|select|list)?\s*(the\s+)?top\s+(\d+)\s+(rows?\s+|records?\s+)?by\s+\"?(?P<column>\w+)\"?$"), ("top",), {
+            "sql": 'SELECT * FROM "data" ORDER BY "{column}" DESC LIMIT {limit}',
+            "explanation": "Showing top {limit} rows by {column}"
+        }),
 
         # Show first N rows
-        r"(?i)(show|display|get|select)\s+(first|top)\s+(\d+)(\s+rows?)?": {
+        (re.compile(r"(show|display|get|select)\s+(first|top)\s+(\d+)(\s+rows?)?"), ("first", "top"), {
             "sql": 'SELECT * FROM "data" LIMIT {limit}',
             "explanation": "Showing first {limit} rows"
-        },
+        }),
 
         # Count all rows
-        r"(?i)(count|total|how\s+many)\s+(all|rows?|records?)": {
+        (re.compile(r"(count|total|how\s+many)\s+(all|rows?|records?)"), ("count", "total", "how"), {
             "sql": 'SELECT COUNT(*) as count FROM "data"',
             "explanation": "Counting total rows in the dataset"
-        },
-        r"(?i)^count$": {
+        }),
+        (re.compile(r"^count$"), ("count",), {
             "sql": 'SELECT COUNT(*) as count FROM "data"',
             "explanation": "Counting total rows in the dataset"
-        },
-    }
+        }),
+    )
+    _PREPARED = _prepare_templates(TEMPLATES)
 
     @classmethod
-    def match(cls, question: str) -> Optional[Dict]:
+    def match(
+        cls,
+        question: str,
+        schema: Optional[Dict] = None,
+        question_lower: Optional[str] = None
+    ) -> Optional[Dict]:
         """
         Try to match question with a template.
         Returns SQL and explanation if matched, None otherwise.
+        Pass question_lower (stripped and lowercased) if already computed.
         """
-        for pattern, template in cls.TEMPLATES.items():
-            match = re.search(pattern, question.strip())
+        if question_lower is None:
+            question_lower = question.strip().lower()
+        for pattern, literals, template, has_column, has_limit, limit_parts in cls._PREPARED:
+            if not any(literal in question_lower for literal in literals):
+                continue
+            match = pattern.search(question_lower)
             if match:
+                values = {}
+
+                # Resolve column references against the schema; if the column
+                # doesn't exist, leave the question to the LLM
+                if has_column:
+                    column = cls._find_column(match.group("column"), schema)
+                    if column is None:
+                        continue
+                    values["column"] = column
+
                 # Extract limit if present
-                if "limit" in template["sql"]:
+                if has_limit:
                     try:
                         limit = int(match.group(3)) if match.lastindex >= 3 else 10
-                        return {
-                            "sql": template["sql"].format(limit=limit),
-                            "explanation": template["explanation"].format(limit=limit)
-                        }
                     except (IndexError, ValueError):
                         pass
+                    else:
+                        if limit_parts is not None:
+                            sql_pre, sql_post, exp_pre, exp_post = limit_parts
+                            return {
+                                "sql": f"{sql_pre}{limit}{sql_post}",
+                                "explanation": f"{exp_pre}{limit}{exp_post}"
+                            }
+                        values["limit"] = limit
+
+                if values:
+                    return {
+                        "sql": template["sql"].format(**values),
+                        "explanation": template["explanation"].format(**values)
+                    }
 
                 return {
                     "sql": template["sql"],
@@ -73,10 +137,35 @@ class QueryTemplate:
 
         return None
 
+    @staticmethod
+    def _find_column(name: str, schema: Optional[Dict]) -> Optional[str]:
+        """
+        Find a schema column by case-insensitive name.
+        Returns the column's exact name, or None if it isn't in the schema.
+        """
+        if not schema or "columns" not in schema:
+            return None
+
+        name_lower = name.lower()
+        for col in schema["columns"]:
+            if col["name"].lower() == name_lower:
+                return col["name"]
+
+        return None
+
 
 class QueryComplexityAnalyzer:
     """Analyzes query complexity to determine routing strategy"""
 
+    # Date/time phrases; complex keywords that always route to the complex model
+    DATETIME_KEYWORDS = [
+        r'\blast\s+(week|month|year|quarter|day)\b',
+        r'\bthis\s+(week|month|year|quarter)\b',
+        r'\byesterday\b', r'\btoday\b', r'\btomorrow\b',
+        r'\bpast\s+\d+\s+(days?|weeks?|months?|years?)\b',
+        r'\bnext\s+\d+\s+(days?|weeks?|months?|years?)\b',
+    ]
+
     # Keywords indicating complex queries
     COMPLEX_KEYWORDS = [
         # Multiple operations
@@ -89,33 +178,55 @@ class QueryComplexityAnalyzer:
         r'\bhaving\b', r'\bcase\b.*\bwhen\b', r'\bcoalesce\b',
         # Multiple joins
         r'\bjoin\b.*\bjoin\b',
-        # Date/time operations (SQL and natural language)
+        # Date/time operations (natural language ones are DATETIME_KEYWORDS)
         r'\bdate_trunc\b', r'\binterval\b', r'\bextract\b',
-        r'\blast\s+(week|month|year|quarter|day)\b',
-        r'\bthis\s+(week|month|year|quarter)\b',
-        r'\byesterday\b', r'\btoday\b', r'\btomorrow\b',
-        r'\bpast\s+\d+\s+(days?|weeks?|months?|years?)\b',
-        r'\bnext\s+\d+\s+(days?|weeks?|months?|years?)\b',
         # Complex conditions
         r'\bbetween\b.*\band\b', r'\bin\b\s*\(.*,.*,.*\)',
         # Multiple exclusions
         r'\bexcluding\b', r'\bexcept\b', r'\bnot\s+in\b',
     ]
 
-    # Keywords indicating medium complexity
-    MEDIUM_KEYWORDS = [
+    # Keywords indicating medium complexity. Plain words are matched as whole
+    # tokens (equivalent to \bword\b); multi-word phrases use regexes.
+    MEDIUM_WORDS = frozenset({
         # Single aggregations
-        r'\bavg\b', r'\bsum\b', r'\bcount\b', r'\bmax\b', r'\bmin\b',
+        "avg", "sum", "count", "max", "min",
         # Grouping
-        r'\bgroup\s+by\b', r'\bper\b',
+        "per",
         # Single join
-        r'\bjoin\b',
+        "join",
         # Sorting
-        r'\border\s+by\b', r'\btop\b', r'\bbottom\b',
+        "top", "bottom",
         # Filtering
-        r'\bwhere\b', r'\bfilter\b', r'\bgreater\b', r'\bless\b',
+        "where", "filter", "greater", "less",
+    })
+    MEDIUM_KEYWORDS = [
+        # Grouping and sorting (analyze() assumes each contains "by")
+        r'\bgroup\s+by\b', r'\border\s+by\b',
     ]
 
+    # Word tokens of a question, split on the same boundaries as \b
+    WORD_RE = re.compile(r"\w+")
+
+    # Compiled once at import; analyze() runs on every query. Keywords are
+    # lowercase and always searched in the lowercased question.
+    # Complex patterns as (pattern, is_datetime), tagged here so analyze()
+    # needn't look each match up in a separate datetime collection
+    COMPLEX_PATTERNS = (
+        tuple((re.compile(p), False) for p in COMPLEX_KEYWORDS)
+        + tuple((re.compile(p), True) for p in DATETIME_KEYWORDS)
+    )
+    MEDIUM_PATTERNS = tuple(re.compile(p) for p in MEDIUM_KEYWORDS)
+
+    # Alternation of the complex keywords, one named group each (dt_N for
+    # date/time keywords, cx_N for the rest): one scan tells whether any
+    # keyword matches, and if the first match is a date/time keyword the
+    # question is complex without running the per-pattern counting loop
+    COMPLEX_ANY_PATTERN = re.compile("|".join(
+        [f"(?P<cx_{i}>{p})" for i, p in enumerate(COMPLEX_KEYWORDS)]
+        + [f"(?P<dt_{i}>{p})" for i, p in enumerate(DATETIME_KEYWORDS)]
+    ))
+
     @classmethod
     def analyze(cls, question: str, schema: Optional[Dict] = None) -> Tuple[QueryComplexity, Dict]:
         """
@@ -124,7 +235,75 @@ class QueryComplexityAnalyzer:
         Returns:
             Tuple of (complexity_level, metadata)
         """
-        question_lower = question.lower()
+        complexity, metadata, _ = cls._analyze_with_template(
+            question.strip().lower(), schema
+        )
+        return complexity, metadata
+
+    @classmethod
+    def _analyze_with_template(
+        cls,
+        question: str,
+        schema: Optional[Dict] = None
+    ) -> Tuple[QueryComplexity, Dict, Optional[Dict]]:
+        """
+        Analyze query complexity, also returning the template match found
+        along the way so the router needn't repeat it. Expects the question
+        already stripped and lowercased.
+
+        Returns:
+            Tuple of (complexity_level, metadata, template_result or None)
+        """
+        complexity, metadata, template_result = cls._analyze_cached(
+            question, cls._schema_key(schema)
+        )
+        # Callers add routing fields to the results, so hand out copies
+        return (
+            complexity,
+            dict(metadata),
+            dict(template_result) if template_result else None
+        )
+
+    @staticmethod
+    def _schema_key(schema: Optional[Dict]) -> Tuple[str, ...]:
+        """
+        Reduce a schema to what analysis depends on: its column names, in
+        order (template matches resolve to the first matching column)
+        """
+        if not schema or "columns" not in schema:
+            return ()
+        return tuple(col["name"] for col in schema["columns"])
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _column_pattern(column_names: Tuple[str, ...]) -> Optional[re.Pattern]:
+        """
+        Compile one alternation of a schema's column names, so finding any
+        column mentioned in a question is a single scan instead of one
+        substring search per column. Cached per column set.
+        """
+        if not column_names:
+            return None
+        return re.compile("|".join(re.escape(name.lower()) for name in column_names))
+
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _analyze_cached(
+        cls,
+        question: str,
+        column_names: Tuple[str, ...]
+    ) -> Tuple[QueryComplexity, Dict, Optional[Dict]]:
+        """
+        Analyze query complexity; a pure function of its arguments, so
+        repeated questions against the same columns are answered from cache.
+        Expects the question already stripped and lowercased. The returned
+        dicts are shared and must not be mutated.
+
+        Returns:
+            Tuple of (complexity_level, metadata, template_result or None)
+        """
+        schema = {"columns": [{"name": name} for name in column_names]}
+        question_lower = question
         word_count = len(question.split())
 
         metadata = {
@@ -134,95 +313,113 @@ class QueryComplexityAnalyzer:
         }
 
         # Check if question mentions specific column names
-        if schema and "columns" in schema:
-            column_names = [col["name"].lower() for col in schema["columns"]]
-            for col_name in column_names:
-                if col_name in question_lower:
-                    metadata["has_column_names"] = True
-                    break
-
-        # Check for template match first
-        if QueryTemplate.match(question):
-            metadata["complexity_score"] = 0
-            metadata["reason"] = "Matches simple template"
-            return QueryComplexity.SIMPLE, metadata
+        column_pattern = cls._column_pattern(column_names)
+        if column_pattern is not None and column_pattern.search(question_lower):
+            metadata["has_column_names"] = True
 
-        # Very short questions are typically simple
+        # Very short questions are typically simple; checked before the
+        # template scoring. The template match is still returned (and cached)
+        # for the router.
         if word_count <= 3:
             metadata["complexity_score"] = 1
             metadata["reason"] = "Very short question"
-            return QueryComplexity.SIMPLE, metadata
+            return (
+                QueryComplexity.SIMPLE,
+                metadata,
+                QueryTemplate.match(question, schema, question_lower)
+            )
+
+        # Check for template match
+        template_result = QueryTemplate.match(question, schema, question_lower)
+        if template_result:
+            metadata["complexity_score"] = 0
+            metadata["reason"] = "Matches simple template"
+            return QueryComplexity.SIMPLE, metadata, template_result
 
         # Check for complex patterns
         complex_matches = 0
         has_datetime = False
-        datetime_patterns = [
-            r'\blast\s+(week|month|year|quarter|day)\b',
-            r'\bthis\s+(week|month|year|quarter)\b',
-            r'\byesterday\b', r'\btoday\b', r'\btomorrow\b',
-            r'\bpast\s+\d+\s+(days?|weeks?|months?|years?)\b',
-            r'\bnext\s+\d+\s+(days?|weeks?|months?|years?)\b',
-        ]
-
-        for pattern in cls.COMPLEX_KEYWORDS:
-            if re.search(pattern, question_lower):
-                complex_matches += 1
-                # Check if this is a date/time pattern
-                if pattern in datetime_patterns:
-                    has_datetime = True
+        first_complex = cls.COMPLEX_ANY_PATTERN.search(question_lower)
+        if first_complex is not None and first_complex.lastgroup.startswith("dt_"):
+            complex_matches = 1
+            has_datetime = True
+        elif first_complex is not None:
+            for pattern, is_datetime in cls.COMPLEX_PATTERNS:
+                if pattern.search(question_lower):
+                    complex_matches += 1
+                    has_datetime = has_datetime or is_datetime
+                    # Either is enough to route as complex; the rest can't
+                    # change the outcome
+                    if has_datetime or complex_matches >= 2:
+                        break
 
         # Date/time queries should always use GPT-4 for better clarification handling
         if has_datetime:
             metadata["complexity_score"] = 3
             metadata["reason"] = "Contains date/time reference (requires clarification handling)"
             metadata["complex_matches"] = complex_matches
-            return QueryComplexity.COMPLEX, metadata
+            return QueryComplexity.COMPLEX, metadata, None
 
         if complex_matches >= 2:
             metadata["complexity_score"] = 3
             metadata["reason"] = f"Multiple complex patterns ({complex_matches})"
             metadata["complex_matches"] = complex_matches
-            return QueryComplexity.COMPLEX, metadata
+            return QueryComplexity.COMPLEX, metadata, None
 
         # Check for medium complexity patterns
-        medium_matches = 0
-        for pattern in cls.MEDIUM_KEYWORDS:
-            if re.search(pattern, question_lower):
-                medium_matches += 1
+        medium_matches = len(cls.MEDIUM_WORDS.intersection(cls.WORD_RE.findall(question_lower)))
+        # Long questions need two matches to count as complex, others one to
+        # count as medium; stop once that is reached. Both phrase patterns
+        # end in "by".
+        medium_needed = 2 if word_count > 15 else 1
+        if medium_matches < medium_needed and "by" in question_lower:
+            for pattern in cls.MEDIUM_PATTERNS:
+                if pattern.search(question_lower):
+                    medium_matches += 1
+                    if medium_matches >= medium_needed:
+                        break
 
         # Long questions with multiple medium keywords are complex
         if word_count > 15 and medium_matches >= 2:
             metadata["complexity_score"] = 3
             metadata["reason"] = "Long question with multiple operations"
             metadata["medium_matches"] = medium_matches
-            return QueryComplexity.COMPLEX, metadata
+            return QueryComplexity.COMPLEX, metadata, None
 
         # Medium complexity if has aggregation/grouping/filtering keywords
         if medium_matches >= 1 or word_count >= 8:
             metadata["complexity_score"] = 2
             metadata["reason"] = "Contains aggregation/grouping/filtering"
             metadata["medium_matches"] = medium_matches
-            return QueryComplexity.MEDIUM, metadata
+            return QueryComplexity.MEDIUM, metadata, None
 
         # Default to simple for short, straightforward questions
         metadata["complexity_score"] = 1
         metadata["reason"] = "Simple query"
-        return QueryComplexity.SIMPLE, metadata
+        return QueryComplexity.SIMPLE, metadata, None
 
 
 class QueryRouter:
     """
     Routes queries to appropriate generation strategy based on complexity.
 
-    Strategy:
+    Strategy (models are configurable, defaults shown):
     - SIMPLE: Use template-based generation (free, instant)
     - MEDIUM: Use GPT-3.5-turbo ($0.001 per query)
     - COMPLEX: Use GPT-4 ($0.024 per query)
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        simple_model: str = "template",
+        medium_model: str = "gpt-3.5-turbo",
+        complex_model: str = "gpt-4"
+    ):
         self.analyzer = QueryComplexityAnalyzer()
         self.template = QueryTemplate()
+        self.simple_model = simple_model
+        self.medium_model = medium_model
+        self.complex_model = complex_model
 
     def route(
         self,
@@ -244,36 +441,46 @@ class QueryRouter:
             - template_result: Dict with SQL and explanation if template matched, None otherwise
             - metadata: Analysis metadata including routing decision
         """
+        # Normalize once; analysis and template matching both reuse it
+        question_lower = question.strip().lower()
+
         # Allow forcing specific model (useful for A/B testing)
         if force_model:
             if force_model == "template":
-                template_result = self.template.match(question)
+                template_result = self.template.match(question, schema, question_lower)
                 return QueryComplexity.SIMPLE, template_result, {"forced": True}
-            elif force_model == "gpt-3.5-turbo":
+            elif force_model == self.medium_model:
                 return QueryComplexity.MEDIUM, None, {"forced": True, "model": force_model}
-            elif force_model == "gpt-4":
+            elif force_model == self.complex_model:
                 return QueryComplexity.COMPLEX, None, {"forced": True, "model": force_model}
 
-        # Analyze complexity
-        complexity, metadata = self.analyzer.analyze(question, schema)
+        # Analyze complexity (cached per question and columns); reuse the
+        # template match analysis already did
+        complexity, metadata, template_result = self.analyzer._analyze_with_template(
+            question_lower, schema
+        )
 
-        # Try template match for simple queries
+        # Simple queries go to templates unless a model is configured for them
         if complexity == QueryComplexity.SIMPLE:
-            template_result = self.template.match(question)
+            if self.simple_model != "template":
+                metadata["strategy"] = self.simple_model
+                metadata["model"] = self.simple_model
+                return complexity, None, metadata
+
             if template_result:
                 metadata["strategy"] = "template"
                 return complexity, template_result, metadata
             else:
                 # No template match, upgrade to medium
                 complexity = QueryComplexity.MEDIUM
-                metadata["reason"] = "No template match, upgraded to GPT-3.5"
+                metadata["reason"] = f"No template match, upgraded to {self.medium_model}"
 
         # Set routing strategy metadata
         if complexity == QueryComplexity.MEDIUM:
-            metadata["strategy"] = "gpt-3.5-turbo"
-            metadata["model"] = "gpt-3.5-turbo"
+            metadata["strategy"] = self.medium_model
+            metadata["model"] = self.medium_model
         elif complexity == QueryComplexity.COMPLEX:
-            metadata["strategy"] = "gpt-4"
-            metadata["model"] = "gpt-4"
+            metadata["strategy"] = self.complex_model
+            metadata["model"] = self.complex_model
 
         return complexity, None, metadata
@@ -0,0 +1,152 @@
+"""
+Semantic cache for LLM responses.
+Reuses answers for paraphrased questions by comparing question embeddings.
+"""
+import math
+import operator
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+
+# Numbers change the meaning of otherwise similar questions ("top 5" vs "top 10")
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# So do quoted literals ("code = 'ABC'" vs "code = 'abc'")
+LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+WORD_RE = re.compile(r"\w+")
+
+# Ordering and aggregate words that flip a question's meaning while barely
+# moving its embedding ("top 5 hotels" vs "bottom 5 hotels")
+MEANING_WORDS = frozenset({
+    "asc", "ascending", "desc", "descending",
+    "top", "bottom", "highest", "lowest", "most", "least",
+    "first", "last", "largest", "smallest", "best", "worst",
+    "min", "minimum", "max", "maximum",
+    "count", "sum", "total", "avg", "average", "mean", "median",
+})
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over question embeddings.
+
+    Entries are grouped by a scope key (model, schema hash, context) so a
+    cached answer is only reused for the same dataset and clarifications.
+    A hit requires cosine similarity >= threshold and the same numbers,
+    quoted literals and ordering/aggregate words in both questions.
+    Entries expire ttl seconds after they are added.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        ttl: float = 3600,
+        max_entries_per_scope: int = 500,
+        max_scopes: int = 100
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        # scope -> question -> (unit vector, signature, expires_at, response),
+        # LRU ordered
+        self._scopes: OrderedDict[Hashable, OrderedDict] = OrderedDict()
+
+    def lookup(
+        self,
+        scope: Hashable,
+        question: str,
+        embedding: List[float]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached response for a semantically equivalent question.
+
+        Args:
+            scope: Cache scope key
+            question: User's natural language question
+            embedding: Question embedding
+
+        Returns:
+            Cached response dict, or None if no close enough match
+        """
+        entries = self._scopes.get(scope)
+        if not entries:
+            return None
+
+        vector = self._normalize(embedding)
+        signature = self._signature(question)
+
+        now = time.monotonic()
+        expired = []
+        best_key, best_score = None, self.threshold
+        for key, (cached_vector, cached_signature, expires_at, _) in entries.items():
+            if expires_at <= now:
+                expired.append(key)
+                continue
+            if cached_signature != signature:
+                continue
+            score = sum(map(operator.mul, vector, cached_vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        for key in expired:
+            del entries[key]
+
+        if best_key is None:
+            return None
+
+        self._scopes.move_to_end(scope)
+        entries.move_to_end(best_key)
+        return entries[best_key][3]
+
+    def add(
+        self,
+        scope: Hashable,
+        question: str,
+        embedding: List[float],
+        response: Dict[str, Any]
+    ) -> None:
+        """
+        Store a response under its question embedding.
+
+        Args:
+            scope: Cache scope key
+            question: User's natural language question
+            embedding: Question embedding
+            response: Parsed LLM response to reuse
+        """
+        entries = self._scopes.setdefault(scope, OrderedDict())
+        self._scopes.move_to_end(scope)
+        if len(self._scopes) > self.max_scopes:
+            self._scopes.popitem(last=False)
+
+        key = " ".join(question.split())
+        entries[key] = (
+            self._normalize(embedding),
+            self._signature(question),
+            time.monotonic() + self.ttl,
+            response
+        )
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries_per_scope:
+            entries.popitem(last=False)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Tuple[float, ...]:
+        """Scale a vector to unit length so dot product equals cosine similarity"""
+        norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+        return tuple(x / norm for x in embedding)
+
+    @staticmethod
+    def _signature(question: str) -> Tuple[Tuple[str, ...], Tuple[str, ...], FrozenSet[str]]:
+        """
+        Extract the parts of a question that embeddings don't reliably
+        separate: its numbers, quoted literals and ordering/aggregate words
+        """
+        words = MEANING_WORDS.intersection(WORD_RE.findall(question.lower()))
+        return (
+            tuple(NUMBER_RE.findall(question)),
+            tuple(LITERAL_RE.findall(question)),
+            frozenset(words)
+        )
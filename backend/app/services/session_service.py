@@ -1,11 +1,19 @@
 """
 Session management service
 """
+import asyncio
+import hashlib
+import logging
 import os
+import time
 import uuid
-from datetime import datetime, timedelta
-from typing import Optional
+import aiofiles
+from datetime import timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 from app.config import settings
+from app.utils.cleanup import ensure_directory
+
+logger = logging.getLogger(__name__)
 
 
 class SessionService:
@@ -13,30 +21,75 @@ class SessionService:
 
     def __init__(self):
         self.uploads_dir = settings.UPLOADS_DIR
+        # Directory with trailing separator, joined once instead of per lookup
+        self._path_prefix = os.path.join(self.uploads_dir, "")
         self.session_ttl = timedelta(hours=settings.SESSION_TTL_HOURS)
+        self.deduplicate_uploads = settings.DEDUPLICATE_UPLOADS
+
+        # Content hash <-> session ID, so byte-identical uploads share a session
+        self._hash_to_session: Dict[str, str] = {}
+        self._session_hashes: Dict[str, str] = {}
+
+        # Sessions known to have a CSV on disk, so the per-request existence
+        # check is a set lookup; rebuilt from disk by each cleanup pass
+        self._known_sessions: Set[str] = set()
 
-        # Ensure uploads directory exists
-        os.makedirs(self.uploads_dir, exist_ok=True)
+        # Ensure uploads directory exists (once per path per process)
+        ensure_directory(self.uploads_dir)
 
-    async def create_session(self, filename: str, content: bytes) -> str:
+    async def create_session(self, filename: str, chunks: AsyncIterator[bytes]) -> str:
         """
-        Create a new session and save CSV file
+        Create a new session and stream the CSV file to disk
 
         Args:
             filename: Original filename
-            content: File content as bytes
+            chunks: Async iterator over the file content
 
         Returns:
             Generated session_id
         """
         # Generate unique session ID
-        session_id = str(uuid.uuid4())
+        session_id = uuid.uuid4().hex
 
-        # Save file
+        # Save file chunk by chunk so the whole upload is never held in memory,
+        # hashing the content on the way through
         csv_path = self.get_csv_path(session_id)
-        with open(csv_path, 'wb') as f:
-            f.write(content)
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            async with aiofiles.open(csv_path, 'wb') as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            # Don't leave a partial file behind (e.g. upload too large)
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+            raise
+
+        self._known_sessions.add(session_id)
 
+        if not self.deduplicate_uploads:
+            return session_id
+
+        content_hash = digest.hexdigest()
+        existing_id = self._hash_to_session.get(content_hash)
+        if existing_id is not None:
+            try:
+                # Identical content was already uploaded: restart that
+                # session's TTL before dropping the new copy
+                os.utime(self.get_csv_path(existing_id))
+            except FileNotFoundError:
+                # Cleanup deleted it in the meantime; keep the fresh upload
+                self._forget_hash(existing_id)
+                self._known_sessions.discard(existing_id)
+            else:
+                # Reuse that session (and its loaded DuckDB table)
+                os.remove(csv_path)
+                self._known_sessions.discard(session_id)
+                return existing_id
+
+        self._hash_to_session[content_hash] = session_id
+        self._session_hashes[session_id] = content_hash
         return session_id
 
     def get_csv_path(self, session_id: str) -> str:
@@ -49,7 +102,7 @@ class SessionService:
         Returns:
             Full path to CSV file
         """
-        return os.path.join(self.uploads_dir, f"{session_id}.csv")
+        return f"{self._path_prefix}{session_id}.csv"
 
     def session_exists(self, session_id: str) -> bool:
         """
@@ -61,8 +114,15 @@ class SessionService:
         Returns:
             True if session exists, False otherwise
         """
-        csv_path = self.get_csv_path(session_id)
-        return os.path.exists(csv_path)
+        if session_id in self._known_sessions:
+            return True
+
+        # Fall back to disk for files this process didn't create (e.g. after
+        # a restart)
+        if os.path.exists(self.get_csv_path(session_id)):
+            self._known_sessions.add(session_id)
+            return True
+        return False
 
     def delete_session(self, session_id: str) -> bool:
         """
@@ -75,6 +135,8 @@ class SessionService:
             True if deleted successfully, False if not found
         """
         csv_path = self.get_csv_path(session_id)
+        self._forget_hash(session_id)
+        self._known_sessions.discard(session_id)
 
         if os.path.exists(csv_path):
             os.remove(csv_path)
@@ -82,49 +144,126 @@ class SessionService:
 
         return False
 
-    def cleanup_expired_sessions(self):
+    def cleanup_expired_sessions(self) -> List[str]:
         """
         Clean up expired session files
+
+        Returns:
+            Session IDs whose CSV files were deleted
+        """
+        known_before = set(self._known_sessions)
+        expired_sessions, live_sessions = self._delete_expired_files()
+        self._apply_cleanup(known_before, expired_sessions, live_sessions)
+        return expired_sessions
+
+    async def cleanup_expired_sessions_async(self) -> List[str]:
+        """
+        Clean up expired session files without blocking the event loop
         Called by background scheduler
+
+        Only the directory scan and deletes run in a worker thread; the
+        in-memory session bookkeeping is updated back on the event loop,
+        where uploads and deletes also change it.
+
+        Returns:
+            Session IDs whose CSV files were deleted
+        """
+        known_before = set(self._known_sessions)
+        expired_sessions, live_sessions = await asyncio.to_thread(self._delete_expired_files)
+        self._apply_cleanup(known_before, expired_sessions, live_sessions)
+        return expired_sessions
+
+    def _delete_expired_files(self) -> Tuple[List[str], Set[str]]:
+        """
+        Delete expired files from the uploads directory. Touches only the
+        filesystem, so it is safe to run in a worker thread.
+
+        Returns:
+            Tuple of (session IDs whose CSVs were deleted, session IDs whose
+            CSVs are still live)
         """
         if not os.path.exists(self.uploads_dir):
-            return
+            return [], set()
 
-        current_time = datetime.now()
+        # Compare raw timestamps rather than building a datetime per file
+        cutoff = time.time() - self.session_ttl.total_seconds()
         deleted_count = 0
+        expired_sessions = []
+        live_sessions: Set[str] = set()
 
-        for filename in os.listdir(self.uploads_dir):
-            file_path = os.path.join(self.uploads_dir, filename)
+        # scandir entries carry the file type from the directory read, so
+        # each file costs one stat() instead of isfile() + getmtime()
+        with os.scandir(self.uploads_dir) as entries:
+            for entry in entries:
+                # Skip if not a file
+                if not entry.is_file(follow_symlinks=False):
+                    continue
 
-            # Skip if not a file
-            if not os.path.isfile(file_path):
-                continue
-
-            # Check if file is expired
-            if self._is_file_expired(file_path, current_time):
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                    print(f"🗑️  Deleted expired session file: {filename}")
-                except Exception as e:
-                    print(f"❌ Failed to delete {filename}: {e}")
+                # Check if file is expired
+                if self._is_entry_expired(entry, cutoff):
+                    try:
+                        os.remove(entry.path)
+                        deleted_count += 1
+                        if entry.name.endswith(".csv"):
+                            expired_sessions.append(entry.name[:-len(".csv")])
+                        logger.debug("Deleted expired session file: %s", entry.name)
+                    except Exception as e:
+                        logger.warning("Failed to delete %s: %s", entry.name, e)
+                elif entry.name.endswith(".csv"):
+                    live_sessions.add(entry.name[:-len(".csv")])
 
+        # One summary line per sweep; individual files are logged at debug level
         if deleted_count > 0:
-            print(f"✅ Cleanup completed: {deleted_count} expired session(s) deleted")
+            logger.info("Cleanup completed: %d expired session(s) deleted", deleted_count)
+
+        return expired_sessions, live_sessions
+
+    def _apply_cleanup(
+        self,
+        known_before: Set[str],
+        expired_sessions: List[str],
+        live_sessions: Set[str]
+    ) -> None:
+        """
+        Update session bookkeeping after a cleanup scan
+
+        Args:
+            known_before: Known sessions when the scan started
+            expired_sessions: Session IDs whose CSVs were deleted
+            live_sessions: Session IDs whose CSVs the scan found live
+        """
+        for session_id in expired_sessions:
+            self._forget_hash(session_id)
+            self._known_sessions.discard(session_id)
+
+        # Forget sessions whose files have disappeared, but keep any created
+        # while the scan was running
+        self._known_sessions.difference_update(known_before - live_sessions)
+
+    def _forget_hash(self, session_id: str) -> None:
+        """
+        Drop the content hash entry for a session
+
+        Args:
+            session_id: Session ID
+        """
+        content_hash = self._session_hashes.pop(session_id, None)
+        if content_hash is not None:
+            self._hash_to_session.pop(content_hash, None)
 
-    def _is_file_expired(self, file_path: str, current_time: datetime) -> bool:
+    @staticmethod
+    def _is_entry_expired(entry: os.DirEntry, cutoff: float) -> bool:
         """
         Check if a file is expired based on modification time
 
         Args:
-            file_path: Path to file
-            current_time: Current datetime
+            entry: Directory entry for the file
+            cutoff: Timestamp before which files are expired
 
         Returns:
             True if file is expired, False otherwise
         """
         try:
-            modified_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-            return (current_time - modified_time) > self.session_ttl
-        except Exception:
+            return entry.stat(follow_symlinks=False).st_mtime < cutoff
+        except OSError:
             return False
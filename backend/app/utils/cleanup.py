@@ -3,7 +3,11 @@ Cleanup utilities for file management
 """
 import os
 import shutil
-from datetime import datetime, timedelta
+import time
+from typing import Set
+
+# Directories already created or confirmed by ensure_directory
+_ENSURED_DIRS: Set[str] = set()
 
 
 def cleanup_directory(directory: str, max_age_hours: int) -> int:
@@ -20,35 +24,37 @@ def cleanup_directory(directory: str, max_age_hours: int) -> int:
     if not os.path.exists(directory):
         return 0
 
-    current_time = datetime.now()
-    max_age = timedelta(hours=max_age_hours)
+    cutoff = time.time() - max_age_hours * 3600
     deleted_count = 0
 
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-
-        if not os.path.isfile(file_path):
-            continue
+    # scandir entries carry the file type, so each file costs one stat()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
 
-        try:
-            modified_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-            if (current_time - modified_time) > max_age:
-                os.remove(file_path)
-                deleted_count += 1
-        except Exception as e:
-            print(f"Error cleaning up {filename}: {e}")
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    os.remove(entry.path)
+                    deleted_count += 1
+            except Exception as e:
+                print(f"Error cleaning up {entry.name}: {e}")
 
     return deleted_count
 
 
 def ensure_directory(directory: str) -> None:
     """
-    Ensure directory exists, create if it doesn't
+    Ensure directory exists, create if it doesn't.
+    Only the first call per path touches the filesystem.
 
     Args:
         directory: Directory path to ensure
     """
+    if directory in _ENSURED_DIRS:
+        return
     os.makedirs(directory, exist_ok=True)
+    _ENSURED_DIRS.add(directory)
 
 
 def get_directory_size(directory: str) -> int:
@@ -61,12 +67,23 @@ def get_directory_size(directory: str) -> int:
     Returns:
         Total size in bytes
     """
-    total_size = 0
+    if not os.path.isdir(directory):
+        return 0
 
-    for dirpath, dirnames, filenames in os.walk(directory):
-        for filename in filenames:
-            file_path = os.path.join(dirpath, filename)
-            if os.path.exists(file_path):
-                total_size += os.path.getsize(file_path)
+    total_size = 0
+    pending = [directory]
+
+    # Walk with scandir so each file costs a single stat()
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        total_size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        # Removed since the directory was read
+                        pass
 
     return total_size
@@ -0,0 +1,133 @@
+"""
+Tests for BatchQueue flushing and error fan-out
+"""
+import asyncio
+
+from app.services.batch_queue import BatchQueue
+
+
+class Recorder:
+    """Single and batch call stand-ins that record what they were sent"""
+
+    def __init__(self, error=None, batch_error=None):
+        self.single_calls = []
+        self.batch_calls = []
+        self.error = error
+        self.batch_error = batch_error
+
+    async def single(self, model, prompt):
+        self.single_calls.append((model, prompt))
+        if self.error is not None:
+            raise self.error
+        return f"reply:{prompt}"
+
+    async def batch(self, model, prompts):
+        self.batch_calls.append((model, list(prompts)))
+        if self.batch_error is not None:
+            raise self.batch_error
+        return [f"batched:{prompt}" for prompt in prompts]
+
+
+def _run(queue_kwargs, recorder, submissions, timeout=1.0):
+    async def run():
+        queue = BatchQueue(recorder.single, recorder.batch, **queue_kwargs)
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    *(queue.submit(model, prompt) for model, prompt in submissions),
+                    return_exceptions=True
+                ),
+                timeout
+            )
+        finally:
+            await queue.close()
+
+    return asyncio.run(run())
+
+
+def test_flushes_when_batch_is_full():
+    recorder = Recorder()
+    # The wait is far longer than the test timeout, so only size can flush
+    replies = _run(
+        {"max_batch": 3, "max_wait": 60},
+        recorder,
+        [("gpt-4", "a"), ("gpt-4", "b"), ("gpt-4", "c")]
+    )
+
+    assert replies == ["batched:a", "batched:b", "batched:c"]
+    assert recorder.batch_calls == [("gpt-4", ["a", "b", "c"])]
+    assert recorder.single_calls == []
+
+
+def test_flushes_partial_batch_after_wait():
+    recorder = Recorder()
+    replies = _run(
+        {"max_batch": 10, "max_wait": 0.02},
+        recorder,
+        [("gpt-4", "a"), ("gpt-4", "b")]
+    )
+
+    assert replies == ["batched:a", "batched:b"]
+    assert recorder.batch_calls == [("gpt-4", ["a", "b"])]
+
+
+def test_single_request_uses_single_call():
+    recorder = Recorder()
+    replies = _run({"max_batch": 10, "max_wait": 0.01}, recorder, [("gpt-4", "a")])
+
+    assert replies == ["reply:a"]
+    assert recorder.batch_calls == []
+
+
+def test_groups_by_model():
+    recorder = Recorder()
+    replies = _run(
+        {"max_batch": 10, "max_wait": 0.02},
+        recorder,
+        [("gpt-4", "a"), ("gpt-3.5-turbo", "b"), ("gpt-4", "c")]
+    )
+
+    assert replies == ["batched:a", "reply:b", "batched:c"]
+    assert recorder.batch_calls == [("gpt-4", ["a", "c"])]
+    assert recorder.single_calls == [("gpt-3.5-turbo", "b")]
+
+
+def test_failed_batch_falls_back_to_single_calls():
+    recorder = Recorder(batch_error=ValueError("bad batch reply"))
+    replies = _run(
+        {"max_batch": 2, "max_wait": 60},
+        recorder,
+        [("gpt-4", "a"), ("gpt-4", "b")]
+    )
+
+    assert replies == ["reply:a", "reply:b"]
+    assert sorted(prompt for _, prompt in recorder.single_calls) == ["a", "b"]
+
+
+def test_exception_reaches_every_waiter():
+    error = RuntimeError("API down")
+    recorder = Recorder(error=error, batch_error=error)
+    replies = _run(
+        {"max_batch": 3, "max_wait": 60},
+        recorder,
+        [("gpt-4", "a"), ("gpt-4", "b"), ("gpt-4", "c")]
+    )
+
+    assert len(replies) == 3
+    for reply in replies:
+        assert isinstance(reply, RuntimeError)
+        assert str(reply) == "API down"
+
+
+def test_close_stops_worker():
+    recorder = Recorder()
+
+    async def run():
+        queue = BatchQueue(recorder.single, recorder.batch, max_batch=2, max_wait=0.01)
+        await queue.submit("gpt-4", "a")
+        worker = queue._worker
+        await queue.close()
+        return worker
+
+    worker = asyncio.run(run())
+    assert worker.done()
@@ -0,0 +1,94 @@
+"""
+Tests for DuckDBService query isolation
+"""
+import pytest
+
+from app.services.duckdb_service import DuckDBService
+
+
+@pytest.fixture
+def service():
+    service = DuckDBService()
+    yield service
+    for session_id in ("a", "b"):
+        service.close_session(session_id)
+
+
+@pytest.fixture
+def csv_paths(tmp_path):
+    a = tmp_path / "a.csv"
+    a.write_text("x,y\n1,a\n2,b\n")
+    b = tmp_path / "b.csv"
+    b.write_text("x,y\n3,c\n")
+    return str(a), str(b)
+
+
+def test_select_returns_rows(service, csv_paths):
+    columns, rows = service.execute_query("a", csv_paths[0], "SELECT x FROM data ORDER BY x;")
+    assert columns == ["x"]
+    assert rows == [{"x": 1}, {"x": 2}]
+
+
+@pytest.mark.parametrize("sql", [
+    "DROP TABLE data",
+    "COMMIT; DROP TABLE data",
+    "SELECT 1; COMMIT",
+    "SELECT 1; DROP TABLE data",
+    "SELECT 1) t; DROP TABLE data; SELECT * FROM (SELECT 1",
+])
+def test_rejects_anything_but_one_select(service, csv_paths, sql):
+    with pytest.raises(ValueError):
+        service.execute_query("a", csv_paths[0], sql)
+
+    _, rows = service.execute_query("a", csv_paths[0], "SELECT COUNT(*) AS n FROM data")
+    assert rows == [{"n": 2}]
+
+
+def test_sessions_cannot_see_each_other(service, csv_paths):
+    service.execute_query("a", csv_paths[0], "SELECT 1")
+    _, rows = service.execute_query(
+        "b", csv_paths[1], "SELECT table_name FROM duckdb_tables()"
+    )
+    assert rows == [{"table_name": "data"}]
+
+    # Other sessions' uploads can't be read from disk either
+    with pytest.raises(Exception, match="disabled"):
+        service.execute_query("b", csv_paths[1], f"SELECT * FROM read_csv_auto('{csv_paths[0]}')")
+
+
+def test_session_database_is_capped(service, csv_paths):
+    _, rows = service.execute_query(
+        "a", csv_paths[0],
+        "SELECT current_setting('threads') AS threads, "
+        "current_setting('memory_limit') AS memory_limit"
+    )
+    assert rows[0]["threads"] == 2
+    assert rows[0]["memory_limit"] == "512.0MB"
+
+
+def test_decimal_values_are_returned_as_floats(service, csv_paths):
+    columns, rows = service.execute_query(
+        "a",
+        csv_paths[0],
+        "SELECT SUM(x)::DECIMAL(10,2) AS s, 1.5 AS literal, NULL::DECIMAL(4,1) AS missing, "
+        "COUNT(*) AS n FROM data"
+    )
+
+    assert columns == ["s", "literal", "missing", "n"]
+    assert rows == [{"s": 3.0, "literal": 1.5, "missing": None, "n": 2}]
+    assert isinstance(rows[0]["s"], float)
+    assert isinstance(rows[0]["n"], int)
+
+
+def test_decimal_sample_values_are_floats(service, tmp_path):
+    csv_path = tmp_path / "prices.csv"
+    csv_path.write_text("price\n1.25\n")
+    # Force a DECIMAL column, as a CSV with a declared type would produce
+    with service.cursor("a", str(csv_path)) as cursor:
+        cursor.execute("ALTER TABLE data ALTER price TYPE DECIMAL(10,2)")
+
+    columns, _ = service.get_schema("a", str(csv_path))
+
+    assert columns[0].type == "DECIMAL(10,2)"
+    assert columns[0].sample == 1.25
+    assert isinstance(columns[0].sample, float)
@@ -0,0 +1,194 @@
+"""
+Tests for LLMService
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.services.llm_service import LLMService
+
+
+SCOPE = ("gpt-4", "schema-hash", "{}")
+SCHEMA = "- price (DOUBLE) e.g. 1.0\n- hotel (VARCHAR) e.g. A"
+QUESTION = "what is the average price per hotel"
+ANSWER = {
+    "sql": 'SELECT hotel, AVG(price) FROM "data" GROUP BY hotel',
+    "ask_clarification": False,
+    "clarification": None,
+    "explanation": "Average price per hotel"
+}
+
+
+class FakeStream:
+    """Async chunk stream shaped like the OpenAI SDK's"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for piece in self.pieces:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    """
+    Stand-in for client.chat.completions. Each call waits for `release`,
+    then either raises `error` or streams ANSWER.
+    """
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.error = error
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.started.set()
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return FakeStream([json.dumps(ANSWER)])
+
+
+def _service(completions: FakeCompletions) -> LLMService:
+    service = LLMService()
+    service.client.chat.completions.create = completions.create
+    return service
+
+
+def _ask(service: LLMService):
+    return service.generate_sql_with_routing(QUESTION, SCHEMA, None, {}, force_model="gpt-4")
+
+
+def test_cache_key_collapses_whitespace():
+    assert LLMService._cache_key(SCOPE, "  top 5   hotels\n") == LLMService._cache_key(SCOPE, "top 5 hotels")
+
+
+def test_cache_key_keeps_case():
+    assert LLMService._cache_key(SCOPE, "rows where code = 'ABC'") != LLMService._cache_key(
+        SCOPE, "rows where code = 'abc'"
+    )
+
+
+def test_concurrent_identical_requests_share_one_call():
+    async def run():
+        completions = FakeCompletions()
+        service = _service(completions)
+        leader = asyncio.create_task(_ask(service))
+        await completions.started.wait()
+        followers = [asyncio.create_task(_ask(service)) for _ in range(2)]
+        await asyncio.sleep(0)
+        completions.release.set()
+        results = await asyncio.gather(leader, *followers)
+        cached = await _ask(service)
+        await service.close()
+        return completions.calls, results, cached
+
+    calls, (leader, *followers), cached = asyncio.run(run())
+
+    assert calls == 1
+    assert leader["sql"] == ANSWER["sql"]
+    assert leader["routing"]["cache_hit"] is False
+    assert "coalesced" not in leader["routing"]
+    for follower in followers:
+        assert follower["sql"] == ANSWER["sql"]
+        assert follower["routing"]["cache_hit"] is False
+        assert follower["routing"]["coalesced"] is True
+    assert cached["routing"]["cache_hit"] is True
+
+
+def test_followers_get_leader_error_without_cache_hit():
+    async def run():
+        completions = FakeCompletions(error=RuntimeError("rate limited"))
+        service = _service(completions)
+        leader = asyncio.create_task(_ask(service))
+        await completions.started.wait()
+        follower = asyncio.create_task(_ask(service))
+        await asyncio.sleep(0)
+        completions.release.set()
+        results = await asyncio.gather(leader, follower)
+        # Errors aren't cached, so the next request calls the LLM again
+        await _ask(service)
+        await service.close()
+        return completions.calls, results
+
+    calls, (leader, follower) = asyncio.run(run())
+
+    assert "rate limited" in leader["error"]
+    assert "rate limited" in follower["error"]
+    assert follower["routing"]["cache_hit"] is False
+    assert follower["routing"]["coalesced"] is True
+    assert calls == 2
+
+
+def test_follower_retries_when_leader_is_cancelled():
+    async def run():
+        completions = FakeCompletions()
+        service = _service(completions)
+        leader = asyncio.create_task(_ask(service))
+        await completions.started.wait()
+        follower = asyncio.create_task(_ask(service))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        completions.release.set()
+        result = await follower
+        leader_cancelled = leader.cancelled()
+        inflight = dict(service._inflight)
+        await service.close()
+        return completions.calls, result, leader_cancelled, inflight
+
+    calls, result, leader_cancelled, inflight = asyncio.run(run())
+
+    assert leader_cancelled
+    assert result["sql"] == ANSWER["sql"]
+    assert "coalesced" not in result["routing"]
+    assert calls == 2
+    assert inflight == {}
+
+
+def _read(pieces):
+    stream = FakeStream(pieces)
+    text = asyncio.run(LLMService._read_stream(stream))
+    return text, stream.closed
+
+
+def test_read_stream_stops_after_first_object():
+    text, closed = _read(['{"sql": "SELECT 1"', '}', ' and some trailing prose'])
+    assert text == '{"sql": "SELECT 1"}'
+    assert closed
+
+
+def test_read_stream_ignores_braces_inside_strings():
+    reply = '{"sql": null, "explanation": "use } and { freely"}'
+    text, _ = _read([reply[:20], reply[20:35], reply[35:], " ignored"])
+    assert text == reply
+    assert json.loads(text)["explanation"] == "use } and { freely"
+
+
+def test_read_stream_handles_escaped_quotes():
+    reply = json.dumps({"explanation": 'say \\"}\\" here', "sql": "SELECT '\"}'"})
+    # Split inside the escape sequence so the state carries across chunks
+    split = reply.index("\\")
+    text, _ = _read([reply[:split + 1], reply[split + 1:], " trailing }"])
+    assert text == reply
+
+
+def test_read_stream_skips_leading_prose():
+    text, _ = _read(['Here is the "answer": ', '{"sql": "SELECT 1"}', " done"])
+    assert text == 'Here is the "answer": {"sql": "SELECT 1"}'
+
+
+def test_read_stream_returns_truncated_reply():
+    text, closed = _read(['{"sql": "SELECT 1", ', '"explanation": "cut o'])
+    assert text == '{"sql": "SELECT 1", "explanation": "cut o'
+    assert closed
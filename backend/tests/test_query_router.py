@@ -0,0 +1,48 @@
+"""
+Tests for query analysis and routing
+"""
+from app.services.query_router import QueryComplexity, QueryComplexityAnalyzer, QueryRouter
+
+
+SCHEMA = {"columns": [{"name": "hotel"}, {"name": "Revenue"}]}
+
+
+def test_analyze_metadata_has_no_private_keys():
+    complexity, metadata = QueryComplexityAnalyzer.analyze("show first 20 rows", SCHEMA)
+
+    assert complexity == QueryComplexity.SIMPLE
+    assert metadata["reason"] == "Matches simple template"
+    assert not any(key.startswith("_") for key in metadata)
+
+
+def test_analyze_normalizes_the_question():
+    assert QueryComplexityAnalyzer.analyze("  Show First 20 ROWS ", SCHEMA) == (
+        QueryComplexityAnalyzer.analyze("show first 20 rows", SCHEMA)
+    )
+
+
+def test_route_returns_template_match():
+    complexity, template_result, metadata = QueryRouter().route("top 5 by revenue", SCHEMA)
+
+    assert complexity == QueryComplexity.SIMPLE
+    assert template_result["sql"] == 'SELECT * FROM "data" ORDER BY "Revenue" DESC LIMIT 5'
+    assert metadata["strategy"] == "template"
+
+
+def test_route_results_are_copies():
+    router = QueryRouter()
+    _, template_result, metadata = router.route("show first 20 rows", SCHEMA)
+    template_result["sql"] = "changed"
+    metadata["cache_hit"] = True
+
+    _, template_result, metadata = router.route("show first 20 rows", SCHEMA)
+    assert template_result["sql"] == 'SELECT * FROM "data" LIMIT 20'
+    assert "cache_hit" not in metadata
+
+
+def test_datetime_questions_route_complex():
+    complexity, template_result, metadata = QueryRouter().route("revenue per hotel last month", SCHEMA)
+
+    assert complexity == QueryComplexity.COMPLEX
+    assert template_result is None
+    assert metadata["model"] == "gpt-4"
@@ -0,0 +1,45 @@
+"""
+Tests for SemanticCache hit guards
+"""
+from app.services.semantic_cache import SemanticCache
+
+
+SCOPE = ("gpt-4", "schema-hash", "{}")
+# Near-identical embeddings, far above the similarity threshold
+EMBEDDING = [1.0, 0.0, 0.01]
+PARAPHRASE = [1.0, 0.0, 0.02]
+
+
+def _cache_with(question: str) -> SemanticCache:
+    cache = SemanticCache(threshold=0.92)
+    cache.add(SCOPE, question, EMBEDDING, {"sql": "cached"})
+    return cache
+
+
+def test_paraphrase_hits():
+    cache = _cache_with("top 5 hotels by revenue")
+    assert cache.lookup(SCOPE, "Top 5 hotels ranked by revenue", PARAPHRASE) == {"sql": "cached"}
+
+
+def test_antonym_paraphrase_misses():
+    cache = _cache_with("top 5 hotels by revenue")
+    assert cache.lookup(SCOPE, "bottom 5 hotels by revenue", PARAPHRASE) is None
+
+
+def test_different_aggregate_misses():
+    cache = _cache_with("max revenue per country")
+    assert cache.lookup(SCOPE, "min revenue per country", PARAPHRASE) is None
+    assert cache.lookup(SCOPE, "sum revenue per country", PARAPHRASE) is None
+
+
+def test_different_numbers_or_literals_miss():
+    cache = _cache_with("top 5 rows where code = 'ABC'")
+    assert cache.lookup(SCOPE, "top 10 rows where code = 'ABC'", PARAPHRASE) is None
+    assert cache.lookup(SCOPE, "top 5 rows where code = 'abc'", PARAPHRASE) is None
+
+
+def test_expired_entry_misses_and_is_dropped():
+    cache = SemanticCache(threshold=0.92, ttl=0)
+    cache.add(SCOPE, "top 5 hotels by revenue", EMBEDDING, {"sql": "cached"})
+    assert cache.lookup(SCOPE, "Top 5 hotels ranked by revenue", PARAPHRASE) is None
+    assert len(cache._scopes[SCOPE]) == 0
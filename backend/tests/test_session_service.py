@@ -0,0 +1,86 @@
+"""
+Tests for SessionService upload handling
+"""
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.config import settings
+from app.services.session_service import SessionService
+
+
+async def _chunks(content: bytes):
+    yield content
+
+
+def _create(service: SessionService, content: bytes) -> str:
+    return asyncio.run(service.create_session("data.csv", _chunks(content)))
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOADS_DIR", str(tmp_path))
+    return SessionService()
+
+
+def test_identical_uploads_get_separate_sessions_by_default(service):
+    first = _create(service, b"a,b\n1,2\n")
+    second = _create(service, b"a,b\n1,2\n")
+
+    assert first != second
+    assert service.delete_session(first)
+    assert service.session_exists(second)
+
+
+def test_dedupe_reuses_existing_session(service):
+    service.deduplicate_uploads = True
+    first = _create(service, b"a,b\n1,2\n")
+
+    assert _create(service, b"a,b\n1,2\n") == first
+    assert len(os.listdir(service.uploads_dir)) == 1
+
+
+def test_dedupe_keeps_fresh_upload_when_existing_file_is_gone(service):
+    service.deduplicate_uploads = True
+    first = _create(service, b"a,b\n1,2\n")
+    # Simulate cleanup removing the file behind the service's back
+    os.remove(service.get_csv_path(first))
+
+    second = _create(service, b"a,b\n1,2\n")
+
+    assert second != first
+    assert os.path.exists(service.get_csv_path(second))
+    assert _create(service, b"a,b\n1,2\n") == second
+
+
+def test_cleanup_deletes_expired_and_keeps_sessions_created_mid_scan(service):
+    expired = _create(service, b"a,b\n1,2\n")
+    os.utime(service.get_csv_path(expired), (0, 0))
+
+    scanned = threading.Event()
+    created = threading.Event()
+    delete_expired_files = service._delete_expired_files
+
+    def slow_scan():
+        # Hold the worker thread after its scan until an upload has landed
+        result = delete_expired_files()
+        scanned.set()
+        created.wait(5)
+        return result
+
+    service._delete_expired_files = slow_scan
+
+    async def run():
+        cleanup = asyncio.create_task(service.cleanup_expired_sessions_async())
+        await asyncio.to_thread(scanned.wait, 5)
+        fresh = await service.create_session("data.csv", _chunks(b"c,d\n3,4\n"))
+        created.set()
+        return fresh, await cleanup
+
+    fresh, deleted = asyncio.run(run())
+
+    assert deleted == [expired]
+    assert not service.session_exists(expired)
+    assert fresh in service._known_sessions